@@ -0,0 +1,198 @@
+from __future__ import annotations
+
+import json
+import math
+import os
+import threading
+import time
+from collections import deque
+from dataclasses import asdict, dataclass
+from typing import Any, Deque, Dict, List, Optional
+
+from exporter import frame_limit
+
+# Cost units: one candle carried through one computation pass is 1 unit; an
+# upstream call is weighted as the equivalent CPU/latency of many candles.
+CANDLE_PASS_COST = 1.0
+UPSTREAM_CALL_COST = 500.0
+UPSTREAM_PAGE_SIZE = 50000
+
+DEFAULT_CAPACITY = 200_000.0
+DEFAULT_QUEUE_SECONDS = 2.0
+DEFAULT_KEY = "default"
+
+
+@dataclass
+class CostEstimate:
+    frames: int
+    candles: int
+    indicator_passes: int
+    upstream_calls: int
+    units: float
+
+
+@dataclass
+class Ticket:
+    key: str
+    estimate: CostEstimate
+    admitted_at: float
+    queued_ms: float
+
+
+class AdmissionRejected(Exception):
+    """Capacity is full right now; retrying after ``retry_after`` seconds may succeed."""
+
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class ExportTooCostly(Exception):
+    """The estimate exceeds the caller's limit, so the request can never be admitted as is."""
+
+    def __init__(self, reason: str):
+        super().__init__(reason)
+        self.reason = reason
+
+
+def estimate_cost(max_candles_limit: int, frames_cfg: Dict[str, List[Dict]]) -> CostEstimate:
+    """Estimate what an export will cost from its config alone."""
+    candles = 0
+    passes = 0
+    calls = 0
+    for indicators in frames_cfg.values():
+        limit = frame_limit(indicators, max_candles_limit)
+        candles += limit
+        # Alignment plus one pass per indicator over the frame.
+        passes += limit * (1 + len(indicators))
+        # fetch_aggregates asks for up to 5x the limit to cover gaps.
+        calls += max(1, math.ceil(limit * 5 / UPSTREAM_PAGE_SIZE))
+    units = passes * CANDLE_PASS_COST + calls * UPSTREAM_CALL_COST
+    return CostEstimate(len(frames_cfg), candles, passes, calls, units)
+
+
+class AdmissionController:
+    """Per-process budget of in-flight export cost.
+
+    A request is admitted when its estimated units fit both the process
+    capacity and its API key's limit. Otherwise it waits up to
+    ``max_queue_seconds`` for capacity to free up, then is rejected.
+    Estimates and measured usage of recent requests are kept for calibration.
+    """
+
+    def __init__(
+        self,
+        capacity: float = DEFAULT_CAPACITY,
+        key_limits: Optional[Dict[str, float]] = None,
+        max_queue_seconds: float = DEFAULT_QUEUE_SECONDS,
+        history: int = 200,
+    ):
+        self.capacity = float(capacity)
+        self.key_limits = {k: float(v) for k, v in (key_limits or {}).items()}
+        self.max_queue_seconds = float(max_queue_seconds)
+        self.in_flight = 0.0
+        self.in_flight_by_key: Dict[str, float] = {}
+        self.queued = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.samples: Deque[Dict[str, Any]] = deque(maxlen=history)
+        self._cond = threading.Condition()
+
+    def limit_for(self, key: str) -> float:
+        return min(self.key_limits.get(key, self.key_limits.get(DEFAULT_KEY, self.capacity)), self.capacity)
+
+    def acquire(self, key: str, estimate: CostEstimate) -> Ticket:
+        limit = self.limit_for(key)
+        if estimate.units > limit:
+            with self._cond:
+                self.rejected += 1
+            raise ExportTooCostly(
+                f"Estimated cost {estimate.units:.0f} exceeds the per-request limit {limit:.0f}; "
+                "reduce frames, candle limits or indicators"
+            )
+        started = time.monotonic()
+        deadline = started + self.max_queue_seconds
+        with self._cond:
+            self.queued += 1
+            try:
+                while not self._fits(key, estimate.units, limit):
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.rejected += 1
+                        raise AdmissionRejected("Export capacity exhausted, retry later", self._retry_after())
+                    self._cond.wait(remaining)
+            finally:
+                self.queued -= 1
+            self.in_flight += estimate.units
+            self.in_flight_by_key[key] = self.in_flight_by_key.get(key, 0.0) + estimate.units
+            self.admitted += 1
+        return Ticket(key, estimate, time.monotonic(), (time.monotonic() - started) * 1000.0)
+
+    def release(self, ticket: Ticket, usage: Optional[Dict[str, Any]] = None) -> None:
+        elapsed_ms = (time.monotonic() - ticket.admitted_at) * 1000.0
+        with self._cond:
+            self.in_flight -= ticket.estimate.units
+            left = self.in_flight_by_key.get(ticket.key, 0.0) - ticket.estimate.units
+            if left <= 0:
+                self.in_flight_by_key.pop(ticket.key, None)
+            else:
+                self.in_flight_by_key[ticket.key] = left
+            self.samples.append(
+                {
+                    "key": _mask(ticket.key),
+                    "estimate": asdict(ticket.estimate),
+                    "actual": dict(usage or {}, elapsed_ms=round(elapsed_ms, 1)),
+                    "queued_ms": round(ticket.queued_ms, 1),
+                }
+            )
+            self._cond.notify_all()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            samples = list(self.samples)
+            units = sum(s["estimate"]["units"] for s in samples)
+            elapsed = sum(s["actual"]["elapsed_ms"] for s in samples)
+            return {
+                "capacity": self.capacity,
+                "in_flight": self.in_flight,
+                "queued": self.queued,
+                "admitted": self.admitted,
+                "rejected": self.rejected,
+                "key_limits": {_mask(k): v for k, v in self.key_limits.items()},
+                "ms_per_kilounit": (elapsed / units * 1000.0) if units else None,
+                "recent": samples,
+            }
+
+    def _fits(self, key: str, units: float, limit: float) -> bool:
+        return (
+            self.in_flight + units <= self.capacity
+            and self.in_flight_by_key.get(key, 0.0) + units <= limit
+        )
+
+    def _retry_after(self) -> int:
+        # Typical request duration is the best guess for when capacity frees up.
+        recent = [s["actual"]["elapsed_ms"] for s in list(self.samples)[-20:]]
+        if not recent:
+            return 1
+        return max(1, math.ceil(sum(recent) / len(recent) / 1000.0))
+
+
+def _mask(key: str) -> str:
+    if key == DEFAULT_KEY or len(key) <= 4:
+        return key
+    return f"...{key[-4:]}"
+
+
+def controller_from_env() -> AdmissionController:
+    """Build the controller from EXPORT_CAPACITY_UNITS, EXPORT_KEY_LIMITS and EXPORT_ADMISSION_QUEUE_MS.
+
+    EXPORT_KEY_LIMITS is a JSON object mapping API keys (or "default") to a
+    unit limit.
+    """
+    raw_limits = os.environ.get("EXPORT_KEY_LIMITS", "").strip()
+    return AdmissionController(
+        capacity=float(os.environ.get("EXPORT_CAPACITY_UNITS", DEFAULT_CAPACITY)),
+        key_limits=json.loads(raw_limits) if raw_limits else None,
+        max_queue_seconds=float(os.environ.get("EXPORT_ADMISSION_QUEUE_MS", DEFAULT_QUEUE_SECONDS * 1000)) / 1000.0,
+    )
@@ -0,0 +1,509 @@
+from __future__ import annotations
+
+import hashlib
+import importlib
+import itertools
+import logging
+import multiprocessing as mp
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+from dataclasses import dataclass, field
+from multiprocessing.connection import wait as wait_connections
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_HANDLER = "affinity:serve_export"
+DEFAULT_WORKER_THREADS = 4
+DEFAULT_RESPAWN_DELAY = 1.0
+MAX_RESPAWN_DELAY = 60.0
+# A request that was in flight on a crashed worker is retried this many times.
+MAX_REROUTES = 1
+DEFAULT_WORKER_CACHE_MB = 128
+
+
+@dataclass
+class _Slot:
+    index: int
+    process: Any = None
+    conn: Any = None
+    send_lock: threading.Lock = field(default_factory=threading.Lock)
+    alive: bool = False
+    respawn_at: Optional[float] = None
+    restarts: int = 0
+    # Deaths since this slot's process last answered a request; drives backoff.
+    crash_streak: int = 0
+    served: int = 0
+    last_stats: Dict[str, Any] = field(default_factory=dict)
+
+
+@dataclass
+class _Pending:
+    symbol: str
+    payload: Dict[str, Any]
+    future: Future
+    slot: Optional[int]
+    on_settled: Optional[Callable[[], None]] = None
+    reroutes: int = 0
+
+
+class AffinityDispatcher:
+    """Route requests to a fixed local worker process per symbol.
+
+    Symbols are mapped with rendezvous hashing over the live workers, so each
+    symbol always lands on the same process and that process's candle and
+    indicator caches stay hot. When a worker dies only its symbols move: its
+    in-flight requests are resubmitted to their new owners (once; a request
+    that is in flight on a second crash fails, so one poison request cannot
+    take down every worker), and after ``respawn_delay`` a fresh process
+    takes the slot (and its symbols) back. The delay doubles, up to
+    MAX_RESPAWN_DELAY, while a slot keeps dying without answering anything.
+    Each worker has its own duplex pipe, so a worker killed mid-write cannot
+    wedge the others.
+
+    Workers may keep working on a request after replying (frames abandoned
+    at the deadline); a request's ``on_settled`` callback runs once its
+    worker reports that nothing is left running, or once that worker dies.
+    """
+
+    def __init__(
+        self,
+        workers: int,
+        handler: str = DEFAULT_HANDLER,
+        worker_threads: int = DEFAULT_WORKER_THREADS,
+        respawn_delay: float = DEFAULT_RESPAWN_DELAY,
+        monitor_interval: float = 0.2,
+    ):
+        if workers < 1:
+            raise ValueError("AffinityDispatcher needs at least one worker")
+        self.handler = handler
+        self.worker_threads = worker_threads
+        self.respawn_delay = respawn_delay
+        self.monitor_interval = monitor_interval
+        # spawn, not fork: the API process runs threads that must not be cloned.
+        self._ctx = mp.get_context("spawn")
+        self._slots = [_Slot(i) for i in range(workers)]
+        self._pending: Dict[int, _Pending] = {}
+        # Answered requests whose worker may still be busy with them.
+        self._settling: Dict[int, _Pending] = {}
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+
+    # --- lifecycle ---
+
+    def start(self) -> None:
+        if self._threads:
+            return
+        self._stop.clear()
+        for slot in self._slots:
+            self._spawn(slot)
+        for target, name in ((self._read_results, "affinity-results"), (self._monitor, "affinity-monitor")):
+            t = threading.Thread(target=target, name=name, daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def stop(self, timeout: float = 5.0) -> None:
+        self._stop.set()
+        with self._lock:
+            slots = list(self._slots)
+            pending = list(self._pending.values())
+            settling = list(self._settling.values())
+            self._pending.clear()
+            self._settling.clear()
+        for slot in slots:
+            if slot.alive:
+                self._send(slot, None)
+        for slot in slots:
+            if slot.process is not None:
+                slot.process.join(timeout)
+                if slot.process.is_alive():
+                    slot.process.terminate()
+            slot.alive = False
+        for t in self._threads:
+            t.join(timeout)
+        self._threads = []
+        for p in pending:
+            if not p.future.done():
+                p.future.set_exception(RuntimeError("affinity dispatcher stopped"))
+        _settle(pending + settling)
+
+    # --- routing ---
+
+    def owner(self, symbol: str) -> Optional[int]:
+        """Slot index that currently owns ``symbol``; None if no worker is alive."""
+        live = [s.index for s in self._slots if s.alive]
+        if not live:
+            return None
+        return max(live, key=lambda i: _score(symbol, i))
+
+    def submit(
+        self, symbol: str, payload: Dict[str, Any], on_settled: Optional[Callable[[], None]] = None
+    ) -> Future:
+        return self._submit(symbol, payload, on_settled)[1]
+
+    def call(
+        self,
+        symbol: str,
+        payload: Dict[str, Any],
+        timeout: Optional[float] = None,
+        on_settled: Optional[Callable[[], None]] = None,
+    ) -> Any:
+        """Run ``payload`` on the symbol's worker and wait for the answer.
+
+        On timeout the request is dropped: it will not be rerouted again, and
+        its ``on_settled`` still runs once its worker is done with it.
+        """
+        req_id, fut = self._submit(symbol, payload, on_settled)
+        try:
+            return fut.result(timeout)
+        except FutureTimeout:
+            self._abandon(req_id)
+            raise
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            in_flight: Dict[Optional[int], int] = {}
+            for p in self._pending.values():
+                in_flight[p.slot] = in_flight.get(p.slot, 0) + 1
+            return {
+                "workers": [
+                    {
+                        "slot": s.index,
+                        "pid": s.process.pid if s.process is not None else None,
+                        "alive": s.alive,
+                        "restarts": s.restarts,
+                        "crash_streak": s.crash_streak,
+                        "served": s.served,
+                        "in_flight": in_flight.get(s.index, 0),
+                        "worker": s.last_stats,
+                    }
+                    for s in self._slots
+                ],
+                "unrouted": in_flight.get(None, 0),
+            }
+
+    # --- internals ---
+
+    def _submit(
+        self, symbol: str, payload: Dict[str, Any], on_settled: Optional[Callable[[], None]]
+    ) -> Tuple[int, Future]:
+        fut: Future = Future()
+        req_id = next(self._ids)
+        with self._lock:
+            self._pending[req_id] = _Pending(symbol.upper(), payload, fut, None, on_settled)
+            self._route(req_id)
+        return req_id, fut
+
+    def _abandon(self, req_id: int) -> None:
+        with self._lock:
+            pending = self._pending.pop(req_id, None)
+            if pending is None:
+                return
+            if pending.slot is not None and pending.on_settled is not None:
+                # Its worker may still be running it; settle when it reports.
+                self._settling[req_id] = pending
+                return
+        if pending.slot is None:
+            _settle([pending])
+
+    def _route(self, req_id: int) -> None:
+        # Caller holds self._lock. Requests with no live owner wait for a respawn.
+        pending = self._pending[req_id]
+        target = self.owner(pending.symbol)
+        pending.slot = target
+        if target is not None:
+            self._send(self._slots[target], (req_id, pending.payload))
+
+    def _send(self, slot: _Slot, item: Any) -> None:
+        try:
+            with slot.send_lock:
+                slot.conn.send(item)
+        except (OSError, EOFError, BrokenPipeError):
+            # The monitor notices the dead process and reroutes its requests.
+            pass
+
+    def _spawn(self, slot: _Slot) -> None:
+        if slot.conn is not None:
+            slot.conn.close()
+        slot.conn, child_conn = self._ctx.Pipe(duplex=True)
+        slot.process = self._ctx.Process(
+            target=_worker_main,
+            args=(slot.index, child_conn, self.handler, self.worker_threads),
+            name=f"affinity-worker-{slot.index}",
+            daemon=True,
+        )
+        slot.process.start()
+        child_conn.close()
+        slot.alive = True
+        slot.respawn_at = None
+
+    def _read_results(self) -> None:
+        while not self._stop.is_set():
+            with self._lock:
+                conns = {s.conn: s for s in self._slots if s.alive}
+            if not conns:
+                self._stop.wait(self.monitor_interval)
+                continue
+            try:
+                ready = wait_connections(list(conns), timeout=self.monitor_interval)
+            except OSError:
+                continue  # a connection was closed by a respawn; take a fresh snapshot
+            for conn in ready:
+                try:
+                    item = conn.recv()
+                except (EOFError, OSError):
+                    with self._lock:
+                        settled = self._mark_dead(conns[conn])
+                    _settle(settled)
+                    continue
+                if len(item) == 1:
+                    with self._lock:
+                        settled = [p for p in [self._settling.pop(item[0], None)] if p is not None]
+                    _settle(settled)
+                    continue
+                self._resolve(conns[conn], *item)
+
+    def _resolve(self, slot: _Slot, req_id: int, ok: bool, value: Any, worker_stats: Dict[str, Any]) -> None:
+        with self._lock:
+            pending = self._pending.pop(req_id, None)
+            if pending is not None and pending.on_settled is not None:
+                self._settling[req_id] = pending
+            slot.served += 1
+            slot.crash_streak = 0
+            if worker_stats:
+                slot.last_stats = worker_stats
+        if pending is None or pending.future.done():
+            return
+        if ok:
+            pending.future.set_result(value)
+        else:
+            pending.future.set_exception(RuntimeError(value))
+
+    def _monitor(self) -> None:
+        while not self._stop.wait(self.monitor_interval):
+            settled: List[_Pending] = []
+            with self._lock:
+                for slot in self._slots:
+                    if slot.alive and not slot.process.is_alive():
+                        settled += self._mark_dead(slot)
+                    elif not slot.alive and slot.respawn_at is not None:
+                        if time.monotonic() >= slot.respawn_at:
+                            self._spawn(slot)
+                            slot.restarts += 1
+                            self._reroute(lambda p: p.slot is None)
+            _settle(settled)
+
+    def _mark_dead(self, slot: _Slot) -> List[_Pending]:
+        """Reroute the slot's requests; returns the ones that are finished for good.
+
+        Those are requests already answered and requests out of reroutes.
+        Caller holds self._lock and passes the result to ``_settle`` after
+        releasing it.
+        """
+        if not slot.alive:
+            return []
+        slot.alive = False
+        slot.crash_streak += 1
+        delay = min(self.respawn_delay * 2 ** (slot.crash_streak - 1), MAX_RESPAWN_DELAY)
+        slot.respawn_at = time.monotonic() + delay
+        logger.warning(
+            "affinity worker %d (pid %s) died; rebalancing, respawn in %.1fs",
+            slot.index, slot.process.pid, delay,
+        )
+        finished = [p for p in self._settling.values() if p.slot == slot.index]
+        self._settling = {k: p for k, p in self._settling.items() if p.slot != slot.index}
+        for req_id, pending in list(self._pending.items()):
+            if pending.slot != slot.index:
+                continue
+            if pending.reroutes >= MAX_REROUTES:
+                # Probably the request that is killing workers: stop it here.
+                finished.append(self._pending.pop(req_id))
+                continue
+            pending.reroutes += 1
+            self._route(req_id)
+        return finished
+
+    def _reroute(self, predicate: Callable[[_Pending], bool]) -> None:
+        for req_id, pending in list(self._pending.items()):
+            if predicate(pending):
+                self._route(req_id)
+
+
+def _settle(pending: List[_Pending]) -> None:
+    # Requests still unanswered here lost their worker for good.
+    for p in pending:
+        if not p.future.done():
+            p.future.set_exception(RuntimeError("affinity worker died while serving the request"))
+        if p.on_settled is not None:
+            try:
+                p.on_settled()
+            except Exception:
+                logger.exception("on_settled callback failed")
+
+
+def _score(symbol: str, slot: int) -> int:
+    digest = hashlib.blake2b(f"{symbol}\0{slot}".encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big")
+
+
+# --- worker side ---
+
+class WorkerState:
+    """State owned by one worker process for the symbols routed to it.
+
+    Only whole results are kept: a private LRU of candle batches and merged
+    indicator frames, plus the SDK clients. There is no per-symbol indicator
+    state that is advanced bar by bar; a frame whose window moved is rebuilt
+    from its candles (and Polygon's indicator endpoints) in full.
+    """
+
+    def __init__(self, slot: int):
+        self.slot = slot
+        self._lock = threading.Lock()
+        self._rest_clients: Dict[str, Any] = {}
+        self._cache = None
+        self._request = threading.local()
+
+    @property
+    def cache(self):
+        with self._lock:
+            if self._cache is None:
+                from shared_cache import LocalCache, cache_from_env
+
+                mb = float(os.environ.get("AFFINITY_WORKER_CACHE_MB", DEFAULT_WORKER_CACHE_MB))
+                self._cache = LocalCache(max_bytes=int(mb * 1024 * 1024), backing=cache_from_env())
+            return self._cache
+
+    def client(self, api_key: str):
+        from polygon_client import PolygonDataClient
+
+        with self._lock:
+            rest = self._rest_clients.get(api_key)
+        client = PolygonDataClient(api_key, rest_client=rest)
+        with self._lock:
+            self._rest_clients.setdefault(api_key, client.client)
+        return client
+
+    def defer_settle(self) -> Callable[[], None]:
+        """Take over reporting that the current request's work has finished.
+
+        By default a request counts as settled once its handler returns;
+        handlers that leave work running call this and invoke the returned
+        callback when it is done.
+        """
+        ctx = self._request.ctx
+        ctx.deferred = True
+        return ctx.settle
+
+    def stats(self) -> Dict[str, Any]:
+        out: Dict[str, Any] = {"pid": os.getpid(), "rss_bytes": _rss_bytes()}
+        if self._cache is not None:
+            out["cache"] = self._cache.stats()
+        return out
+
+
+class _RequestContext:
+    """Worker-side bookkeeping so the settled notice always follows the answer."""
+
+    def __init__(self, req_id: int, reply: Callable[..., None]):
+        self.req_id = req_id
+        self.reply = reply
+        self.deferred = False
+        self._answered = False
+        self._settled = False
+        self._lock = threading.Lock()
+
+    def answer(self, ok: bool, value: Any, worker_stats: Dict[str, Any]) -> None:
+        self.reply(self.req_id, ok, value, worker_stats)
+        with self._lock:
+            self._answered = True
+            notify = self._settled or not self.deferred
+        if notify:
+            self.reply(self.req_id)  # a one-element item reports the request as settled
+
+    def settle(self) -> None:
+        with self._lock:
+            self._settled = True
+            notify = self._answered
+        if notify:
+            self.reply(self.req_id)
+
+
+def serve_export(payload: Dict[str, Any], state: WorkerState) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """Default worker handler: run one export and report its usage."""
+    from datetime import datetime
+
+    from exporter import build_export
+    from ny_sessions import to_ny
+
+    client = state.client(payload["api_key"])
+    usage: Dict[str, Any] = {"worker": state.slot}
+    export = build_export(
+        client,
+        payload["symbol"],
+        to_ny(datetime.fromisoformat(payload["as_of"])),
+        int(payload["max_candles_limit"]),
+        payload["frames_cfg"],
+        cache=state.cache,
+        deadline_seconds=payload.get("deadline_seconds"),
+        on_settled=state.defer_settle(),
+    )
+    usage["candles"] = sum(len(rows) for rows in export["frames"].values())
+    usage["upstream_calls"] = client.upstream_calls
+    return export, usage
+
+
+def _worker_main(slot: int, conn, handler_path: str, threads: int) -> None:
+    module_name, func_name = handler_path.split(":")
+    handler = getattr(importlib.import_module(module_name), func_name)
+    state = WorkerState(slot)
+    send_lock = threading.Lock()
+
+    def reply(*item: Any) -> None:
+        with send_lock:
+            try:
+                conn.send(item)
+            except (OSError, ValueError):
+                pass  # the dispatcher has gone away
+
+    def serve(req_id: int, payload: Dict[str, Any]) -> None:
+        ctx = state._request.ctx = _RequestContext(req_id, reply)
+        try:
+            ctx.answer(True, handler(payload, state), state.stats())
+        except Exception as e:
+            ctx.answer(False, f"{type(e).__name__}: {e}", state.stats())
+
+    with ThreadPoolExecutor(max_workers=threads, thread_name_prefix=f"affinity-{slot}") as pool:
+        while True:
+            try:
+                item = conn.recv()
+            except (EOFError, OSError):
+                break
+            if item is None:
+                break
+            pool.submit(serve, *item)
+
+
+def _rss_bytes() -> Optional[int]:
+    try:
+        with open("/proc/self/statm", "r", encoding="ascii") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def dispatcher_from_env() -> Optional[AffinityDispatcher]:
+    """Build the dispatcher when AFFINITY_WORKERS > 0; None otherwise."""
+    workers = int(os.environ.get("AFFINITY_WORKERS", "0") or 0)
+    if workers <= 0:
+        return None
+    return AffinityDispatcher(
+        workers,
+        worker_threads=int(os.environ.get("AFFINITY_WORKER_THREADS", DEFAULT_WORKER_THREADS)),
+        respawn_delay=float(os.environ.get("AFFINITY_RESPAWN_DELAY", DEFAULT_RESPAWN_DELAY)),
+    )
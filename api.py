@@ -1,16 +1,21 @@
 from __future__ import annotations
 
+from contextlib import asynccontextmanager
 from datetime import datetime
-from typing import Any, Dict, List, Optional
+from functools import lru_cache, partial
+from typing import Any, Dict, List, Optional, Tuple
 import os
+import threading
 
-import pandas as pd
 from dateutil import parser as dtparser
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, Header, HTTPException, Query, Response
+from fastapi.responses import StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel, Field
 
-from merge import align_candles_to_grid, attach_indicators, frame_to_export_rows
+# Only light modules are imported here so cold starts and the cheap endpoints
+# (/health, /v1/market_status, /v1/time_grid) never pay for pandas or the
+# Polygon SDK. The export path imports them on first use.
 from ny_sessions import (
     align_to_boundary_ny,
     classify_session,
@@ -18,10 +23,36 @@ from ny_sessions import (
     market_status,
     to_ny,
 )
-from polygon_client import PolygonDataClient
+from response_encoding import (
+    IDENTITY,
+    body_encoding,
+    compress,
+    compress_chunks,
+    dumps,
+    encoding_headers,
+    export_chunks,
+    min_bytes,
+    negotiate,
+)
+from time_engine import epoch_seconds, ny_datetime
+
+
+@asynccontextmanager
+async def _lifespan(app: FastAPI):
+    # Background workers are attached by create_app() and run for the app's lifetime.
+    workers = [
+        w for w in (getattr(app.state, "dispatcher", None), getattr(app.state, "prefetcher", None)) if w is not None
+    ]
+    for w in workers:
+        w.start()
+    try:
+        yield
+    finally:
+        for w in reversed(workers):
+            w.stop()
 
 
-app = FastAPI(title="Polygon Export API", version="1.0.0")
+app = FastAPI(title="Polygon Export API", version="1.0.0", lifespan=_lifespan)
 
 allowed_origins_env = os.environ.get("ALLOW_ORIGINS", "")
 if allowed_origins_env.strip():
@@ -89,22 +120,88 @@ def get_market_status(at: Optional[str] = None) -> Dict[str, str]:
     }
 
 
+# Largest grid /v1/time_grid will build, and largest one kept in the
+# in-process body cache (about 30 KB of JSON, so 512 entries stay small).
+MAX_GRID_COUNT = 5000
+MAX_CACHED_GRID_COUNT = 1000
+
+
 @app.get("/v1/time_grid")
-def get_time_grid(end: str, timeframe: str, count: int = 50) -> Dict[str, Any]:
+def get_time_grid(
+    end: str,
+    timeframe: str,
+    count: int = Query(default=50, ge=1, le=MAX_GRID_COUNT),
+    accept_encoding: Optional[str] = Header(default=None),
+) -> Response:
     try:
         end_dt = dtparser.parse(end)
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Invalid end datetime: {e}")
     end_aligned = align_to_boundary_ny(end_dt, timeframe)
+    build = _cached_time_grid_body if count <= MAX_CACHED_GRID_COUNT else _time_grid_body
+    body, encoding = build(epoch_seconds(end_aligned), timeframe, count, negotiate(accept_encoding), min_bytes())
+    return Response(body, media_type="application/json", headers=encoding_headers(encoding))
+
+
+def _time_grid_body(end_epoch: int, timeframe: str, count: int, encoding: str, threshold: int) -> Tuple[bytes, str]:
+    end_aligned = ny_datetime(end_epoch)
     grid = generate_time_grid(end_aligned, count, timeframe)
-    return {
-        "end_aligned": end_aligned.strftime("%Y-%m-%d %H:%M:%S %z"),
-        "timestamps": [ts.strftime("%Y-%m-%d %H:%M:%S %z") for ts in grid],
-    }
+    body = dumps(
+        {
+            "end_aligned": end_aligned.strftime("%Y-%m-%d %H:%M:%S %z"),
+            "timestamps": [ts.strftime("%Y-%m-%d %H:%M:%S %z") for ts in grid],
+        }
+    )
+    if encoding == IDENTITY or len(body) < threshold:
+        return body, IDENTITY
+    return compress(body, encoding), encoding
+
+
+# Grids are pure functions of their arguments (including the compression
+# threshold), so small encoded bodies are cached as is.
+_cached_time_grid_body = lru_cache(maxsize=512)(_time_grid_body)
+
+
+# Lazily built per-process singletons (shared cache, admission controller).
+_shared_cache_state: Dict[str, Any] = {}
+
+
+def get_shared_cache():
+    """Host-wide cache shared by all uvicorn workers (None unless SHARED_CACHE_PATH is set)."""
+    if "cache" not in _shared_cache_state:
+        from shared_cache import cache_from_env
+
+        _shared_cache_state["cache"] = cache_from_env()
+    return _shared_cache_state["cache"]
+
+
+def get_admission_controller():
+    """Per-process export cost budget, configured from EXPORT_* settings on first use."""
+    if "admission" not in _shared_cache_state:
+        from admission import controller_from_env
+
+        _shared_cache_state["admission"] = controller_from_env()
+    return _shared_cache_state["admission"]
+
+
+AFFINITY_TIMEOUT_MARGIN = 5.0
+
+
+def default_export_timeout_ms() -> int:
+    return int(os.environ.get("EXPORT_TIMEOUT_MS", "15000"))
 
 
 @app.post("/v1/export")
-def export_data(req: ExportRequest) -> Dict[str, Any]:
+def export_data(
+    req: ExportRequest,
+    timeout_ms: Optional[int] = Query(
+        default=None,
+        ge=1,
+        description="Time budget in milliseconds; frames not ready in time are returned as timed_out",
+    ),
+    accept_encoding: Optional[str] = Header(default=None),
+) -> Response:
+    from admission import DEFAULT_KEY, AdmissionRejected, ExportTooCostly, estimate_cost
     symbol = req.symbol.upper()
     try:
         as_of_ny: datetime = to_ny(dtparser.parse(req.as_of))
@@ -113,61 +210,181 @@ def export_data(req: ExportRequest) -> Dict[str, Any]:
 
     api_key = req.api_key
     if not api_key:
-        import os
         api_key = os.environ.get("POLYGON_API_KEY")
     if not api_key:
         raise HTTPException(status_code=400, detail="POLYGON_API_KEY not provided.")
 
-    client = PolygonDataClient(api_key)
-
     max_candles_limit: int = int(req.config.max_candles_limit)
-    frames_cfg = req.config.config
-
-    export: Dict[str, Any] = {
-        "version": "1.1.0",
-        "as_of_utc": to_ny(as_of_ny).astimezone(pd.Timestamp("now", tz="UTC").tz).strftime("%Y-%m-%d %H:%M:%S UTC"),
-        "as_of_edt": to_ny(as_of_ny).strftime("%Y-%m-%d %H:%M:%S %z"),
-        "source": "polygon.io",
-        "ticker": symbol,
-        "market_status": market_status(as_of_ny),
-        "market_session": classify_session(as_of_ny),
-        "timezone": "America/New_York",
-        "frames": {},
+    frames_cfg = {
+        timeframe: [ind.model_dump() for ind in indicators]
+        for timeframe, indicators in req.config.config.items()
     }
 
-    for timeframe, indicators in frames_cfg.items():
-        per_frame_limit = max(
-            [int(ind.candle_limit or max_candles_limit) for ind in indicators] + [max_candles_limit]
-        )
-        end_aligned = align_to_boundary_ny(as_of_ny, timeframe)
-
-        candles = client.fetch_aggregates(symbol, timeframe, end_aligned, per_frame_limit)
-
-        grid = generate_time_grid(end_aligned, per_frame_limit, timeframe)
-        base_df = align_candles_to_grid(grid, candles)
-
-        indicators_map: Dict[str, Any] = {}
-        fallback_df = base_df.copy()
-        for ind in indicators:
-            series = client.fetch_indicator_series(
-                symbol=symbol,
-                timeframe=timeframe,
-                indicator=ind.indicator,
-                params=ind.params,
-                limit=per_frame_limit,
-                candles_for_fallback=fallback_df,
+    # Finished exports are cached already serialised and compressed, per API
+    # key, so a repeat hit skips admission, building, serialisation and
+    # compression. A hit only returns bytes this same key already fetched.
+    encoding = negotiate(accept_encoding)
+    cache = get_shared_cache()
+    body_key = None
+    if cache is not None:
+        from exporter import export_body_key, get_export_body
+        from polygon_client import cache_scope
+
+        body_key = export_body_key(symbol, as_of_ny, max_candles_limit, frames_cfg, encoding, cache_scope(api_key))
+        body = get_export_body(cache, body_key)
+        if body is not None:
+            # Bodies under the size threshold were stored uncompressed.
+            headers = dict(encoding_headers(body_encoding(body)), **{"X-Export-Cache": "hit"})
+            return Response(body, media_type="application/json", headers=headers)
+
+    controller = get_admission_controller()
+    estimate = estimate_cost(max_candles_limit, frames_cfg)
+    try:
+        ticket = controller.acquire(req.api_key or DEFAULT_KEY, estimate)
+    except ExportTooCostly as e:
+        raise HTTPException(status_code=413, detail=e.reason)
+    except AdmissionRejected as e:
+        raise HTTPException(status_code=429, detail=e.reason, headers={"Retry-After": str(e.retry_after)})
+
+    budget_ms = timeout_ms if timeout_ms is not None else default_export_timeout_ms()
+    # Time spent queued for admission counts against the budget.
+    deadline_seconds = max(budget_ms - ticket.queued_ms, 0.0) / 1000.0
+    usage: Dict[str, Any] = {}
+    # Capacity is held until the response is built and every frame of the
+    # export has stopped: frames abandoned at the deadline still use CPU and
+    # upstream calls in the background.
+    release = _after_calls(2, partial(controller.release, ticket, usage))
+    try:
+        dispatcher = getattr(app.state, "dispatcher", None)
+        if dispatcher is not None:
+            export, worker_usage = _export_via_dispatcher(
+                dispatcher, symbol, as_of_ny, max_candles_limit, frames_cfg, api_key, deadline_seconds, release
+            )
+            usage.update(worker_usage)
+        else:
+            from exporter import build_export
+            from polygon_client import PolygonDataClient
+
+            try:
+                client = PolygonDataClient(api_key)
+            except Exception:
+                release()  # nothing was started
+                raise
+
+            def settled() -> None:
+                usage["upstream_calls"] = client.upstream_calls
+                release()
+
+            export = build_export(
+                client,
+                symbol,
+                as_of_ny,
+                max_candles_limit,
+                frames_cfg,
+                cache=cache,
+                deadline_seconds=deadline_seconds,
+                on_settled=settled,
             )
-            if isinstance(series, pd.DataFrame):
-                indicators_map.update({col: series[col] for col in series.columns})
-            else:
-                indicators_map[ind.name] = series.rename(ind.name)
+            usage["candles"] = sum(len(rows) for rows in export["frames"].values())
+    finally:
+        release()
+
+    complete = all(s["status"] == "ok" for s in export.get("frame_status", {}).values())
+    store = None
+    if body_key is not None and complete:
+        from exporter import export_body_ttl, put_export_body
+
+        store = partial(put_export_body, cache, body_key, ttl=export_body_ttl(cache, as_of_ny, frames_cfg))
+    headers = {"X-Export-Cost": f"{estimate.units:.0f}", "X-Export-Cache": "miss"}
+    return _encoded_response(export_chunks(export), encoding, headers, store)
+
+
+def _encoded_response(chunks: List[bytes], encoding: str, headers: Dict[str, str], store=None) -> Response:
+    """Send ``chunks`` uncompressed when small, otherwise compress them as they stream out.
+
+    The chunks are already serialised (the export is complete by now); only
+    compression happens incrementally, one chunk at a time.
+
+    ``store`` receives the complete body as sent once the stream has finished.
+    """
+    if encoding == IDENTITY or sum(len(c) for c in chunks) < min_bytes():
+        body = b"".join(chunks)
+        if store is not None:
+            store(body)
+        return Response(body, media_type="application/json", headers=dict(headers, Vary="Accept-Encoding"))
+
+    def stream():
+        sent: List[bytes] = []
+        for out in compress_chunks(chunks, encoding):
+            sent.append(out)
+            yield out
+        if store is not None:
+            store(b"".join(sent))
+
+    return StreamingResponse(stream(), media_type="application/json", headers=dict(headers, **encoding_headers(encoding)))
+
+
+def _after_calls(count: int, fn) -> Any:
+    """Return a callable that runs ``fn`` on its ``count``-th call."""
+    lock = threading.Lock()
+    left = [count]
+
+    def call() -> None:
+        with lock:
+            left[0] -= 1
+            ready = left[0] == 0
+        if ready:
+            fn()
+
+    return call
+
+
+def _export_via_dispatcher(
+    dispatcher, symbol, as_of_ny, max_candles_limit, frames_cfg, api_key, deadline_seconds, on_settled=None
+):
+    from concurrent.futures import TimeoutError as FutureTimeout
+
+    payload = {
+        "symbol": symbol,
+        "as_of": as_of_ny.isoformat(),
+        "max_candles_limit": max_candles_limit,
+        "frames_cfg": frames_cfg,
+        "api_key": api_key,
+        "deadline_seconds": deadline_seconds,
+    }
+    try:
+        # Workers enforce the deadline themselves; the margin covers IPC and a reroute.
+        return dispatcher.call(
+            symbol, payload, timeout=deadline_seconds + AFFINITY_TIMEOUT_MARGIN, on_settled=on_settled
+        )
+    except FutureTimeout:
+        raise HTTPException(status_code=504, detail="Export worker did not respond in time")
+    except RuntimeError as e:
+        raise HTTPException(status_code=502, detail=f"Export worker failed: {e}")
 
-        merged = attach_indicators(base_df, indicators_map)
-        export_rows = frame_to_export_rows(merged, tz_label="EDT")
-        export["frames"][timeframe] = export_rows
 
-    return export
+@app.get("/v1/workers")
+def get_worker_stats() -> Dict[str, Any]:
+    """Symbol-affinity worker status: liveness, restarts, cache hit rates and memory."""
+    dispatcher = getattr(app.state, "dispatcher", None)
+    if dispatcher is None:
+        return {"mode": "in-process", "workers": []}
+    return dict(dispatcher.stats(), mode="affinity")
+
+
+@app.get("/v1/admission")
+def get_admission_stats() -> Dict[str, Any]:
+    """Admission counters plus estimated vs measured cost of recent exports."""
+    return get_admission_controller().stats()
 
 
 def create_app() -> FastAPI:
+    if not hasattr(app.state, "dispatcher"):
+        from affinity import dispatcher_from_env
+
+        app.state.dispatcher = dispatcher_from_env()
+    if not hasattr(app.state, "prefetcher"):
+        from prefetch import prefetcher_from_env
+
+        app.state.prefetcher = prefetcher_from_env(get_shared_cache)
     return app
@@ -0,0 +1,89 @@
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from typing import Dict, List
+
+# Modules that must not be imported on the cold-start path. They are loaded on
+# first use by the export code.
+HEAVY_MODULES = ["pandas", "numpy", "polygon", "massive", "yaml", "dotenv"]
+
+# Each probe runs in a fresh interpreter and prints a JSON report.
+_PROBES: Dict[str, str] = {
+    "api": (
+        "from api import create_app, health\n"
+        "app = create_app()\n"
+        "health()\n"
+    ),
+    "fetch_polygon": "import fetch_polygon\n",
+}
+
+_PROBE_TEMPLATE = """
+import json, sys, time
+t0 = time.perf_counter()
+{body}
+elapsed_ms = (time.perf_counter() - t0) * 1000.0
+heavy = [m for m in {heavy!r} if m in sys.modules]
+print(json.dumps({{"elapsed_ms": elapsed_ms, "heavy": heavy}}))
+"""
+
+DEFAULT_BUDGET_MS = 1500.0
+
+
+def run_probe(target: str) -> Dict:
+    code = _PROBE_TEMPLATE.format(body=_PROBES[target], heavy=HEAVY_MODULES)
+    out = subprocess.run(
+        [sys.executable, "-c", code],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def measure(target: str, runs: int = 5) -> Dict:
+    samples: List[float] = []
+    heavy: List[str] = []
+    for _ in range(runs):
+        report = run_probe(target)
+        samples.append(report["elapsed_ms"])
+        heavy = report["heavy"]
+    return {
+        "target": target,
+        "runs": runs,
+        "median_ms": statistics.median(samples),
+        "max_ms": max(samples),
+        "heavy_modules": heavy,
+    }
+
+
+def budget_ms() -> float:
+    return float(os.environ.get("STARTUP_BUDGET_MS", DEFAULT_BUDGET_MS))
+
+
+def main() -> int:
+    p = argparse.ArgumentParser(description="Measure cold-start import time against a budget")
+    p.add_argument("--runs", type=int, default=5)
+    p.add_argument("--budget-ms", type=float, default=None, help="Median budget per target (or STARTUP_BUDGET_MS)")
+    args = p.parse_args()
+
+    limit = args.budget_ms if args.budget_ms is not None else budget_ms()
+    failed = False
+    for target in _PROBES:
+        result = measure(target, args.runs)
+        ok = result["median_ms"] <= limit and not result["heavy_modules"]
+        failed = failed or not ok
+        print(
+            f"{target:<14} median={result['median_ms']:.0f}ms max={result['max_ms']:.0f}ms "
+            f"budget={limit:.0f}ms heavy={result['heavy_modules']} {'OK' if ok else 'OVER BUDGET'}"
+        )
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,389 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from merge import align_candles_to_grid, attach_indicators, frame_to_export_rows
+from ny_sessions import (
+    NY_TZ,
+    UTC_TZ,
+    align_to_boundary_ny,
+    bar_close_ny,
+    classify_session,
+    generate_time_grid,
+    market_status,
+    previous_boundary_ny,
+    to_ny,
+)
+from polygon_client import Candle, PolygonDataClient, upstream_deadline
+from shared_cache import SharedCache
+from time_engine import epoch_seconds, ny_datetimes
+
+EXPORT_VERSION = "1.1.0"
+_PRICE_COLS = ["open", "high", "low", "close", "volume"]
+
+FRAME_OK = "ok"
+FRAME_TIMED_OUT = "timed_out"
+FRAME_ERROR = "error"
+
+DEFAULT_FRAME_WORKERS = 8
+
+
+class FrameCancelled(Exception):
+    """Raised inside a frame build once its request's deadline has passed."""
+
+
+def frame_limit(indicators: List[Dict], max_candles_limit: int) -> int:
+    return max(
+        [int(ind.get("candle_limit") or max_candles_limit) for ind in indicators] + [max_candles_limit]
+    )
+
+
+def export_header(symbol: str, as_of_ny: datetime) -> Dict[str, Any]:
+    return {
+        "version": EXPORT_VERSION,
+        "as_of_utc": to_ny(as_of_ny).astimezone(UTC_TZ).strftime("%Y-%m-%d %H:%M:%S UTC"),
+        "as_of_edt": to_ny(as_of_ny).strftime("%Y-%m-%d %H:%M:%S %z"),
+        "source": "polygon.io",
+        "ticker": symbol,
+        "market_status": market_status(as_of_ny),
+        "market_session": classify_session(as_of_ny),
+        "timezone": "America/New_York",
+        "frames": {},
+    }
+
+
+def build_export(
+    client: PolygonDataClient,
+    symbol: str,
+    as_of_ny: datetime,
+    max_candles_limit: int,
+    frames_cfg: Dict[str, List[Dict]],
+    cache: Optional[SharedCache] = None,
+    deadline_seconds: Optional[float] = None,
+    on_settled: Optional[Callable[[], None]] = None,
+) -> Dict[str, Any]:
+    """Build the full export.
+
+    Without a deadline frames are built one after another and any failure
+    propagates. With one, frames are built concurrently; frames still running
+    when the deadline passes are cancelled and reported as ``timed_out``
+    (with their last cached rows, if any), and failing frames as ``error``.
+    Per-frame outcomes are listed under ``frame_status``.
+
+    Each request gets its own threads (at most EXPORT_FRAME_WORKERS), so
+    frames abandoned at the deadline never hold up other requests, and
+    upstream calls are given the deadline as their HTTP timeout.
+
+    ``on_settled`` is called exactly once, when no work for this export is
+    left running; with a deadline that can be after this function returns.
+    """
+    if deadline_seconds is None:
+        try:
+            export = export_header(symbol, as_of_ny)
+            for timeframe, indicators in frames_cfg.items():
+                export["frames"][timeframe] = build_frame(
+                    client, symbol, timeframe, indicators, as_of_ny, max_candles_limit, cache=cache
+                )
+            return export
+        finally:
+            if on_settled is not None:
+                on_settled()
+
+    cancel = threading.Event()
+    deadline = time.monotonic() + max(deadline_seconds, 0.0)
+    pool = ThreadPoolExecutor(
+        max_workers=max(1, min(len(frames_cfg), _frame_workers())), thread_name_prefix="export-frame"
+    )
+    futures: Dict[str, Future] = {}
+    try:
+        futures = {
+            timeframe: pool.submit(
+                build_frame,
+                client,
+                symbol,
+                timeframe,
+                indicators,
+                as_of_ny,
+                max_candles_limit,
+                cache,
+                cancel,
+                deadline=deadline,
+            )
+            for timeframe, indicators in frames_cfg.items()
+        }
+        wait(list(futures.values()), timeout=max(deadline - time.monotonic(), 0.0))
+    finally:
+        cancel.set()
+        # Frames still running finish (or hit their HTTP timeout) on their own threads.
+        pool.shutdown(wait=False, cancel_futures=True)
+        if on_settled is not None:
+            _when_all_done(list(futures.values()), on_settled)
+
+    export = export_header(symbol, as_of_ny)
+    export["frame_status"] = {}
+    for timeframe, fut in futures.items():
+        if fut.done() and not fut.cancelled() and fut.exception() is None:
+            export["frames"][timeframe] = fut.result()
+            export["frame_status"][timeframe] = {"status": FRAME_OK}
+            continue
+        if fut.done() and not fut.cancelled() and not isinstance(fut.exception(), FrameCancelled):
+            exc = fut.exception()
+            status = {"status": FRAME_ERROR, "detail": str(exc) or type(exc).__name__}
+        else:
+            fut.cancel()
+            status = {"status": FRAME_TIMED_OUT}
+        rows = cached_frame_rows(
+            symbol, timeframe, frames_cfg[timeframe], as_of_ny, max_candles_limit, cache, client.cache_scope
+        )
+        status["cached"] = rows is not None
+        export["frames"][timeframe] = rows or []
+        export["frame_status"][timeframe] = status
+    return export
+
+
+def cached_frame_rows(
+    symbol: str,
+    timeframe: str,
+    indicators: List[Dict],
+    as_of_ny: datetime,
+    max_candles_limit: int,
+    cache: Optional[SharedCache],
+    scope: str,
+) -> Optional[List[Dict]]:
+    """Most recent cached rows for a frame, ignoring expiry; None if nothing is cached."""
+    if cache is None:
+        return None
+    per_frame_limit = frame_limit(indicators, max_candles_limit)
+    end_aligned = align_to_boundary_ny(as_of_ny, timeframe)
+    # The current window first, then the one before the last bar close.
+    for end in (end_aligned, previous_boundary_ny(end_aligned, timeframe)):
+        hit = cache.get(_frame_key(scope, symbol, timeframe, end, per_frame_limit, indicators), allow_expired=True)
+        if hit is not None:
+            return frame_to_export_rows(_columns_to_frame(hit), tz_label="EDT")
+    return None
+
+
+def export_body_key(
+    symbol: str,
+    as_of_ny: datetime,
+    max_candles_limit: int,
+    frames_cfg: Dict[str, List[Dict]],
+    encoding: str,
+    scope: str,
+) -> str:
+    """Cache key for a serialised (and possibly compressed) export body.
+
+    ``scope`` is the caller's :func:`polygon_client.cache_scope`, so a body is
+    only ever served back to the API key that fetched it.
+    """
+    spec = json.dumps([max_candles_limit, frames_cfg], sort_keys=True)
+    digest = hashlib.sha1(spec.encode("utf-8")).hexdigest()[:16]
+    return f"body:{EXPORT_VERSION}:{scope}:{symbol}:{epoch_seconds(as_of_ny)}:{digest}:{encoding}"
+
+
+def export_body_ttl(cache: SharedCache, as_of_ny: datetime, frames_cfg: Dict[str, List[Dict]]) -> float:
+    # The body is only as fresh as its least settled frame.
+    return min(
+        [_ttl(cache, align_to_boundary_ny(as_of_ny, tf), tf) for tf in frames_cfg] or [cache.closed_ttl]
+    )
+
+
+def get_export_body(cache: Optional[SharedCache], key: str) -> Optional[bytes]:
+    if cache is None:
+        return None
+    hit = cache.get(key)
+    return hit["body"].tobytes() if hit is not None else None
+
+
+def put_export_body(cache: SharedCache, key: str, body: bytes, ttl: float) -> None:
+    cache.put(key, {"body": np.frombuffer(body, dtype=np.uint8)}, ttl)
+
+
+def build_frame(
+    client: PolygonDataClient,
+    symbol: str,
+    timeframe: str,
+    indicators: List[Dict],
+    as_of_ny: datetime,
+    max_candles_limit: int,
+    cache: Optional[SharedCache] = None,
+    cancel: Optional[threading.Event] = None,
+    deadline: Optional[float] = None,
+) -> List[Dict]:
+    """Fetch, align and merge one timeframe into export rows.
+
+    With a cache, the merged frame is looked up first and the candle batch is
+    reused across indicator configs; both are published after computing.
+    ``cancel`` is checked before each upstream call and indicator, and
+    ``deadline`` (``time.monotonic()``) bounds the upstream HTTP calls.
+    """
+    per_frame_limit = frame_limit(indicators, max_candles_limit)
+    end_aligned = align_to_boundary_ny(as_of_ny, timeframe)
+
+    frame_key = _frame_key(client.cache_scope, symbol, timeframe, end_aligned, per_frame_limit, indicators)
+    if cache is not None:
+        hit = cache.get(frame_key)
+        if hit is not None:
+            return frame_to_export_rows(_columns_to_frame(hit), tz_label="EDT")
+
+    _check_cancelled(cancel)
+    candles = fetch_candles(client, symbol, timeframe, end_aligned, per_frame_limit, cache=cache, deadline=deadline)
+
+    grid = generate_time_grid(end_aligned, per_frame_limit, timeframe)
+    base_df = align_candles_to_grid(grid, candles)
+
+    indicators_map: Dict[str, Any] = {}
+    fallback_df = base_df.copy()
+    for ind in indicators:
+        _check_cancelled(cancel)
+        series = client.fetch_indicator_series(
+            symbol=symbol,
+            timeframe=timeframe,
+            indicator=ind["indicator"],
+            params=ind.get("params") or {},
+            limit=per_frame_limit,
+            candles_for_fallback=fallback_df,
+        )
+        if isinstance(series, pd.DataFrame):
+            indicators_map.update({col: series[col] for col in series.columns})
+        else:
+            indicators_map[ind["name"]] = series.rename(ind["name"])
+
+    merged = attach_indicators(base_df, indicators_map)
+    if cache is not None:
+        cache.put(frame_key, _frame_to_columns(merged), _ttl(cache, end_aligned, timeframe))
+    return frame_to_export_rows(merged, tz_label="EDT")
+
+
+def fetch_candles(
+    client: PolygonDataClient,
+    symbol: str,
+    timeframe: str,
+    end_aligned: datetime,
+    limit: int,
+    cache: Optional[SharedCache] = None,
+    deadline: Optional[float] = None,
+) -> List[Candle]:
+    """Candles for the window ending at ``end_aligned``.
+
+    With a cache, a window whose newest bar is still forming is assembled
+    from the closed window before it (cached with the closed TTL) plus a
+    one-bar fetch of the forming bar, and is itself kept only for the live
+    TTL. Closed history is fetched once per bar, and the forming bar is never
+    served older than the live TTL.
+    """
+    key = f"candles:{client.cache_scope}:{symbol}:{timeframe}:{epoch_seconds(end_aligned)}:{limit}"
+    if cache is not None:
+        hit = cache.get(key)
+        if hit is not None:
+            return _columns_to_candles(hit)
+    if cache is not None and limit > 1 and not _is_closed(end_aligned, timeframe):
+        previous = previous_boundary_ny(end_aligned, timeframe)
+        closed = fetch_candles(client, symbol, timeframe, previous, limit, cache=cache, deadline=deadline)
+        forming = _fetch_aggregates(client, symbol, timeframe, end_aligned, 1, deadline)
+        candles = ([c for c in closed if c.ts_ny < end_aligned] + [c for c in forming if c.ts_ny >= end_aligned])[-limit:]
+    else:
+        candles = _fetch_aggregates(client, symbol, timeframe, end_aligned, limit, deadline)
+    if cache is not None:
+        cache.put(key, _candles_to_columns(candles), _ttl(cache, end_aligned, timeframe))
+    return candles
+
+
+# --- internals ---
+
+def _fetch_aggregates(
+    client: PolygonDataClient, symbol: str, timeframe: str, end_aligned: datetime, limit: int, deadline: Optional[float]
+) -> List[Candle]:
+    try:
+        with upstream_deadline(deadline):
+            return client.fetch_aggregates(symbol, timeframe, end_aligned, limit)
+    except Exception as exc:
+        if deadline is not None and time.monotonic() >= deadline:
+            raise FrameCancelled() from exc
+        raise
+
+
+def _frame_workers() -> int:
+    return int(os.environ.get("EXPORT_FRAME_WORKERS", DEFAULT_FRAME_WORKERS))
+
+
+def _when_all_done(futures: List[Future], callback: Callable[[], None]) -> None:
+    left = [len(futures)]
+    lock = threading.Lock()
+
+    def done(_: Future) -> None:
+        with lock:
+            left[0] -= 1
+            last = left[0] == 0
+        if last:
+            callback()
+
+    if not futures:
+        callback()
+    for fut in futures:
+        fut.add_done_callback(done)
+
+
+def _check_cancelled(cancel: Optional[threading.Event]) -> None:
+    if cancel is not None and cancel.is_set():
+        raise FrameCancelled()
+
+
+def _frame_key(
+    scope: str, symbol: str, timeframe: str, end_aligned: datetime, limit: int, indicators: List[Dict]
+) -> str:
+    spec = json.dumps(
+        [[ind["name"], ind["indicator"], ind.get("params") or {}] for ind in indicators],
+        sort_keys=True,
+    )
+    digest = hashlib.sha1(spec.encode("utf-8")).hexdigest()[:16]
+    return f"frame:{scope}:{symbol}:{timeframe}:{epoch_seconds(end_aligned)}:{limit}:{digest}"
+
+
+def _is_closed(end_aligned: datetime, timeframe: str, now: Optional[datetime] = None) -> bool:
+    return bar_close_ny(end_aligned, timeframe) <= (now or datetime.now(UTC_TZ))
+
+
+def _ttl(cache: SharedCache, end_aligned: datetime, timeframe: str, now: Optional[datetime] = None) -> float:
+    # The newest bar keeps changing until its interval closes; older windows are final.
+    return cache.closed_ttl if _is_closed(end_aligned, timeframe, now) else cache.live_ttl
+
+
+def _candles_to_columns(candles: List[Candle]) -> Dict[str, np.ndarray]:
+    cols: Dict[str, np.ndarray] = {
+        "ts": np.array([int(c.ts_ny.timestamp() * 1000) for c in candles], dtype=np.int64),
+    }
+    for col in _PRICE_COLS:
+        cols[col] = np.array(
+            [np.nan if getattr(c, col) is None else getattr(c, col) for c in candles], dtype=np.float64
+        )
+    return cols
+
+
+def _columns_to_candles(cols: Dict[str, np.ndarray]) -> List[Candle]:
+    stamps = ny_datetimes(cols["ts"], unit="ms")
+    prices = [[None if np.isnan(v) else float(v) for v in cols[col]] for col in _PRICE_COLS]
+    return [Candle(ts, *row) for ts, row in zip(stamps, zip(*prices))]
+
+
+def _frame_to_columns(df: pd.DataFrame) -> Dict[str, np.ndarray]:
+    index = pd.DatetimeIndex(df.index)
+    cols: Dict[str, np.ndarray] = {"__ts__": index.as_unit("ns").asi8.astype(np.int64)}
+    for col in df.columns:
+        cols[col] = df[col].to_numpy(dtype=np.float64, na_value=np.nan)
+    return cols
+
+
+def _columns_to_frame(cols: Dict[str, np.ndarray]) -> pd.DataFrame:
+    index = pd.DatetimeIndex(pd.to_datetime(cols["__ts__"], unit="ns", utc=True), name="timestamp").tz_convert(NY_TZ.zone)
+    return pd.DataFrame({k: v for k, v in cols.items() if k != "__ts__"}, index=index)
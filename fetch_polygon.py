@@ -5,19 +5,9 @@ import json
 from datetime import datetime
 from typing import Dict, List
 
-import pandas as pd
-import pytz
-import yaml
 from dateutil import parser as dtparser
-from dotenv import load_dotenv
 
-from ny_sessions import align_to_boundary_ny, classify_session, market_status, to_ny
-from polygon_client import PolygonDataClient
-from merge import align_candles_to_grid, attach_indicators, frame_to_export_rows
-
-
-# Load .env if present
-load_dotenv()
+from ny_sessions import to_ny
 
 
 def parse_args() -> argparse.Namespace:
@@ -31,6 +21,8 @@ def parse_args() -> argparse.Namespace:
 
 
 def load_config(path: str) -> Dict:
+    import yaml
+
     with open(path, "r", encoding="utf-8") as f:
         raw = yaml.safe_load(f)
     if isinstance(raw, list):
@@ -43,6 +35,17 @@ def load_config(path: str) -> Dict:
 
 
 def main():
+    # Heavy imports are deferred so `--help` and importing this module for
+    # load_config() stay fast.
+    from dotenv import load_dotenv
+
+    from exporter import build_export
+    from polygon_client import PolygonDataClient
+    from shared_cache import cache_from_env
+
+    # Load .env if present
+    load_dotenv()
+
     args = parse_args()
     cfg = load_config(args.config)
 
@@ -61,56 +64,7 @@ def main():
     max_candles_limit: int = int(cfg.get("max_candles_limit", 200))
     frames_cfg: Dict[str, List[Dict]] = cfg["config"]
 
-    export = {
-        "version": "1.1.0",
-        "as_of_utc": to_ny(as_of_ny).astimezone(pytz.UTC).strftime("%Y-%m-%d %H:%M:%S UTC"),
-        "as_of_edt": to_ny(as_of_ny).strftime("%Y-%m-%d %H:%M:%S %z"),
-        "source": "polygon.io",
-        "ticker": symbol,
-        "market_status": market_status(as_of_ny),
-        "market_session": classify_session(as_of_ny),
-        "timezone": "America/New_York",
-        "frames": {},
-    }
-
-    for timeframe, indicators in frames_cfg.items():
-        per_frame_limit = max(
-            [int(ind.get("candle_limit", max_candles_limit)) for ind in indicators] + [max_candles_limit]
-        )
-        end_aligned = align_to_boundary_ny(as_of_ny, timeframe)
-
-        candles = client.fetch_aggregates(symbol, timeframe, end_aligned, per_frame_limit)
-
-        # Build grid and align
-        from ny_sessions import generate_time_grid
-        grid = generate_time_grid(end_aligned, per_frame_limit, timeframe)
-        base_df = align_candles_to_grid(grid, candles)
-
-        # Indicator series
-        indicators_map: Dict[str, pd.Series | pd.DataFrame] = {}
-        # Provide candles for fallback local computation
-        fallback_df = base_df.copy()
-        for ind in indicators:
-            name = ind["name"]
-            kind = ind["indicator"]
-            params = ind.get("params", {})
-            series = client.fetch_indicator_series(
-                symbol=symbol,
-                timeframe=timeframe,
-                indicator=kind,
-                params=params,
-                limit=per_frame_limit,
-                candles_for_fallback=fallback_df,
-            )
-            # Name columns consistently
-            if isinstance(series, pd.DataFrame):
-                indicators_map.update({col: series[col] for col in series.columns})
-            else:
-                indicators_map[name] = series.rename(name)
-
-        merged = attach_indicators(base_df, indicators_map)
-        export_rows = frame_to_export_rows(merged, tz_label="EDT")
-        export["frames"][timeframe] = export_rows
+    export = build_export(client, symbol, as_of_ny, max_candles_limit, frames_cfg, cache=cache_from_env())
 
     with open(args.output, "w", encoding="utf-8") as f:
         json.dump(export, f, indent=2)
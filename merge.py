@@ -2,12 +2,14 @@ from __future__ import annotations
 
 from dataclasses import asdict
 from datetime import datetime
-from typing import Dict, List, Optional
+from typing import TYPE_CHECKING, Dict, List, Optional
 
 import pandas as pd
 
-from ny_sessions import generate_time_grid
-from polygon_client import Candle
+from time_engine import NY_TZ, format_epochs
+
+if TYPE_CHECKING:
+    from polygon_client import Candle
 
 
 def align_candles_to_grid(
@@ -55,10 +57,11 @@ def frame_to_export_rows(df: pd.DataFrame, tz_label: str) -> List[Dict]:
     # Determine indicator columns once
     base_cols = {"open", "high", "low", "close", "volume"}
     indicator_cols = [c for c in df.columns if c not in base_cols]
+    stamps = _format_timestamps(df.index, tz_label)
 
-    for ts, r in df.iterrows():
+    for stamp, (ts, r) in zip(stamps, df.iterrows()):
         row = {
-            "timestamp": ts.strftime("%Y-%m-%d %H:%M:%S %z").replace("+0000", "UTC") if tz_label == "UTC" else ts.strftime("%Y-%m-%d %H:%M:%S %z"),
+            "timestamp": stamp,
             "open": _round_or_none(r.get("open")),
             "high": _round_or_none(r.get("high")),
             "low": _round_or_none(r.get("low")),
@@ -76,6 +79,17 @@ def frame_to_export_rows(df: pd.DataFrame, tz_label: str) -> List[Dict]:
     return rows
 
 
+def _format_timestamps(index: pd.Index, tz_label: str) -> List[str]:
+    index = pd.DatetimeIndex(index)
+    if tz_label != "UTC" and str(index.tz) == NY_TZ.zone:
+        # NY frames go through the engine's cached formatter on epoch seconds.
+        # Normalise the resolution first: pandas 3 defaults to microseconds.
+        return format_epochs(index.as_unit("ns").asi8 // 1_000_000_000)
+    if tz_label == "UTC":
+        return [ts.strftime("%Y-%m-%d %H:%M:%S %z").replace("+0000", "UTC") for ts in index]
+    return [ts.strftime("%Y-%m-%d %H:%M:%S %z") for ts in index]
+
+
 def _round_or_none(v: Optional[float]) -> Optional[float]:
     if v is None:
         return None
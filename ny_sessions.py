@@ -6,7 +6,9 @@ from typing import Iterable, List
 
 import pytz
 
-NY_TZ = pytz.timezone("America/New_York")
+import time_engine
+from time_engine import NY_TZ
+
 UTC_TZ = pytz.UTC
 
 
@@ -32,7 +34,7 @@ def ensure_aware(dt: datetime) -> datetime:
 
 
 def to_ny(dt: datetime) -> datetime:
-    return ensure_aware(dt).astimezone(NY_TZ)
+    return time_engine.to_ny_datetime(ensure_aware(dt))
 
 
 def to_utc(dt: datetime) -> datetime:
@@ -59,25 +61,31 @@ def generate_time_grid(
     timeframe: str,
 ) -> List[datetime]:
     # end_inclusive is aligned to the timeframe boundary in NY tz
-    end_ny = to_ny(end_inclusive_ny)
-    delta = _timeframe_to_timedelta(timeframe)
-    grid: List[datetime] = []
-    cur = end_ny
-    for _ in range(count):
-        grid.append(cur)
-        cur = cur - delta
-    grid.reverse()
-    return grid
+    seconds = int(_timeframe_to_timedelta(timeframe).total_seconds())
+    end_epoch = time_engine.epoch_seconds(ensure_aware(end_inclusive_ny))
+    return time_engine.ny_grid(end_epoch, count, seconds)
 
 
 def align_to_boundary_ny(dt: datetime, timeframe: str) -> datetime:
-    ny = to_ny(dt)
-    delta = _timeframe_to_timedelta(timeframe)
-    # Snap down to boundary
-    seconds = int(delta.total_seconds())
-    epoch = int(ny.timestamp())
-    snapped_epoch = (epoch // seconds) * seconds
-    return datetime.fromtimestamp(snapped_epoch, NY_TZ)
+    # Snap down to the NY session-anchored boundary (4h bars start at 04:00,
+    # 08:00, ...; 1d bars at NY midnight) rather than to UTC epoch multiples.
+    seconds = int(_timeframe_to_timedelta(timeframe).total_seconds())
+    epoch = time_engine.epoch_seconds(ensure_aware(dt))
+    return time_engine.ny_datetime(time_engine.snap_epoch(epoch, seconds))
+
+
+def bar_close_ny(start_ny: datetime, timeframe: str) -> datetime:
+    """Close of the bar starting at the aligned ``start_ny`` (DST aware)."""
+    seconds = int(_timeframe_to_timedelta(timeframe).total_seconds())
+    start = time_engine.epoch_seconds(ensure_aware(start_ny))
+    return time_engine.ny_datetime(time_engine.bucket_end(start, seconds))
+
+
+def previous_boundary_ny(start_ny: datetime, timeframe: str) -> datetime:
+    """Start of the bar before the one starting at the aligned ``start_ny``."""
+    seconds = int(_timeframe_to_timedelta(timeframe).total_seconds())
+    start = time_engine.epoch_seconds(ensure_aware(start_ny))
+    return time_engine.ny_datetime(time_engine.previous_bucket(start, seconds))
 
 
 def _timeframe_to_timedelta(tf: str) -> timedelta:
@@ -1,19 +1,72 @@
 from __future__ import annotations
 
+import hashlib
+import threading
+import time
+from contextlib import contextmanager
 from dataclasses import dataclass
 from datetime import datetime, timedelta
-from typing import Dict, List, Optional, Any, Iterable
+from functools import lru_cache
+from typing import Dict, List, Optional, Any, Iterable, Tuple
 
-import numpy as np
 import pandas as pd
 
-# Prefer Polygon (as per task), fallback to Massive (rebrand)
-try:
-    from polygon import RESTClient  # type: ignore
-    _CLIENT_KIND = "polygon"
-except Exception:  # pragma: no cover
-    from massive import RESTClient  # type: ignore
-    _CLIENT_KIND = "massive"
+from ny_sessions import to_utc
+from time_engine import ny_datetimes
+
+
+@lru_cache(maxsize=None)
+def _rest_client_cls() -> Tuple[Any, str]:
+    # Prefer Polygon (as per task), fallback to Massive (rebrand).
+    # Imported on first client construction: the SDK is the slowest import
+    # in the tree and most processes (tests, /health) never need it.
+    try:
+        from polygon import RESTClient  # type: ignore
+        return RESTClient, "polygon"
+    except Exception:  # pragma: no cover
+        from massive import RESTClient  # type: ignore
+        return RESTClient, "massive"
+
+
+_deadline = threading.local()
+
+
+@contextmanager
+def upstream_deadline(at: Optional[float]):
+    """Cap upstream HTTP calls made by this thread at ``at`` (``time.monotonic()``).
+
+    Requests past the deadline fail with ``TimeoutError`` instead of being
+    sent; in-flight ones get a total timeout of the time remaining.
+    """
+    previous = getattr(_deadline, "at", None)
+    _deadline.at = at
+    try:
+        yield
+    finally:
+        _deadline.at = previous
+
+
+class _DeadlinePoolManager:
+    """Wraps the SDK's urllib3 PoolManager to apply the calling thread's deadline."""
+
+    def __init__(self, pool: Any):
+        self._pool = pool
+
+    def request(self, method: str, url: str, **kwargs: Any) -> Any:
+        at = getattr(_deadline, "at", None)
+        if at is not None:
+            remaining = at - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError("upstream deadline exceeded")
+            import urllib3
+
+            kwargs["timeout"] = urllib3.Timeout(total=remaining)
+            # urllib3 would restart the timeout on every retry.
+            kwargs["retries"] = False
+        return self._pool.request(method, url, **kwargs)
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._pool, name)
 
 
 @dataclass
@@ -26,9 +79,26 @@ class Candle:
     volume: Optional[float]
 
 
+def cache_scope(api_key: str) -> str:
+    """Short, non-reversible tag for ``api_key``; prefixes every cache key the key's data is stored under."""
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:16]
+
+
 class PolygonDataClient:
-    def __init__(self, api_key: str):
-        self.client = RESTClient(api_key=api_key)
+    def __init__(self, api_key: str, rest_client: Optional[Any] = None):
+        # A long-lived process may pass in an existing SDK client to reuse its
+        # HTTP connection pool across requests.
+        rest_client_cls, self.client_kind = _rest_client_cls()
+        self.client = rest_client if rest_client is not None else rest_client_cls(api_key=api_key)
+        pool = getattr(self.client, "client", None)
+        if pool is not None and hasattr(pool, "request") and not isinstance(pool, _DeadlinePoolManager):
+            self.client.client = _DeadlinePoolManager(pool)
+        # Cached data is only shared between callers using the same API key.
+        self.cache_scope = cache_scope(api_key)
+        # Number of aggregate requests sent upstream; used to calibrate admission
+        # cost. Locked: one client serves all frames of an export from several threads.
+        self.upstream_calls = 0
+        self._calls_lock = threading.Lock()
 
     def fetch_aggregates(
         self,
@@ -38,8 +108,10 @@ class PolygonDataClient:
         limit: int,
     ) -> List[Candle]:
         multiplier, timespan = self._parse_tf(timeframe)
+        with self._calls_lock:
+            self.upstream_calls += 1
         # Use end_ny to derive a back window
-        end_utc = pd.Timestamp(end_ny).tz_convert("UTC").to_pydatetime()
+        end_utc = to_utc(end_ny)
         lookback = self._tf_to_timedelta(timeframe) * (limit * 4)
         start_utc = end_utc - lookback
 
@@ -56,8 +128,9 @@ class PolygonDataClient:
                 to=to_str,
                 limit=50000,
             )
-            for a in aggs_iter:
-                ts = pd.to_datetime(getattr(a, "timestamp"), unit="ms", utc=True).tz_convert("America/New_York").to_pydatetime()
+            aggs = list(aggs_iter)
+            stamps = ny_datetimes([getattr(a, "timestamp") for a in aggs], unit="ms")
+            for ts, a in zip(stamps, aggs):
                 rows.append(Candle(ts, a.open, a.high, a.low, a.close, float(getattr(a, "volume", 0) or 0)))
         else:
             # Polygon style
@@ -70,8 +143,9 @@ class PolygonDataClient:
                 limit=limit * 5,
                 sort="desc",
             )
-            for a in aggs:
-                ts = pd.to_datetime(a.timestamp, unit="ms", utc=True).tz_convert("America/New_York").to_pydatetime()
+            aggs = list(aggs)
+            stamps = ny_datetimes([a.timestamp for a in aggs], unit="ms")
+            for ts, a in zip(stamps, aggs):
                 rows.append(Candle(ts, a.open, a.high, a.low, a.close, float(a.volume) if a.volume is not None else 0.0))
 
         rows.sort(key=lambda r: r.ts_ny)
@@ -146,6 +220,6 @@ def _rsi(prices: pd.Series, window: int) -> pd.Series:
     delta = prices.diff()
     gain = (delta.clip(lower=0)).ewm(alpha=1/window, adjust=False).mean()
     loss = (-delta.clip(upper=0)).ewm(alpha=1/window, adjust=False).mean()
-    rs = gain / loss.replace(0, np.nan)
+    rs = gain / loss.replace(0, float("nan"))
     rsi = 100 - (100 / (1 + rs))
     return rsi
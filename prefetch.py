@@ -0,0 +1,168 @@
+from __future__ import annotations
+
+import logging
+import os
+import threading
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from ny_sessions import NY_TZ, align_to_boundary_ny, bar_close_ny, classify_session
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_GRACE_SECONDS = 1.0
+LEADER_RETRY_SECONDS = 5.0
+
+
+class BarClosePrefetcher:
+    """Warm the shared cache right after each bar closes for a fixed watchlist.
+
+    A daemon thread sleeps until the next timeframe boundary (plus a small
+    grace period so Polygon has published the bar), then rebuilds every due
+    frame for every watched symbol. The first user request after the close
+    then hits the cache instead of stampeding Polygon. Boundaries outside the
+    Pre-Market/Regular/After-Hours sessions are skipped.
+
+    What stays warm for the whole interval is the closed history up to the
+    boundary (closed TTL); the bar that just started forming is kept only
+    for the live TTL, so later requests refetch just that one bar.
+    """
+
+    def __init__(
+        self,
+        watchlist: List[str],
+        config: Dict[str, Any],
+        client_factory: Callable[[], Any],
+        cache: Any,
+        grace_seconds: float = DEFAULT_GRACE_SECONDS,
+    ):
+        self.watchlist = [s.upper() for s in watchlist]
+        self.max_candles_limit = int(config.get("max_candles_limit", 200))
+        self.frames_cfg: Dict[str, List[Dict]] = config["config"]
+        self.client_factory = client_factory
+        self.cache = cache
+        self.grace = timedelta(seconds=grace_seconds)
+        self._client = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._lock_file = None
+
+    def next_boundary(self, now: datetime) -> Tuple[datetime, List[str]]:
+        """Earliest upcoming bar close after ``now`` and the timeframes closing then."""
+        upcoming: Dict[str, datetime] = {
+            tf: bar_close_ny(align_to_boundary_ny(now, tf), tf) for tf in self.frames_cfg
+        }
+        boundary = min(upcoming.values())
+        return boundary, [tf for tf, at in upcoming.items() if at == boundary]
+
+    def run_once(self, boundary: datetime, timeframes: List[str]) -> int:
+        """Prefetch ``timeframes`` ending at ``boundary``; returns frames built."""
+        if classify_session(boundary) == "Closed":
+            return 0
+        from exporter import build_frame
+
+        if self._client is None:
+            self._client = self.client_factory()
+        built = 0
+        for symbol in self.watchlist:
+            for tf in timeframes:
+                try:
+                    build_frame(
+                        self._client,
+                        symbol,
+                        tf,
+                        self.frames_cfg[tf],
+                        boundary,
+                        self.max_candles_limit,
+                        cache=self.cache,
+                    )
+                    built += 1
+                except Exception:
+                    logger.exception("prefetch failed for %s %s", symbol, tf)
+        return built
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="bar-close-prefetcher", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5.0)
+            self._thread = None
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
+
+    def _acquire_leader(self) -> bool:
+        # Every uvicorn worker builds a prefetcher; an flock next to the cache
+        # file makes exactly one of them do the work on each host.
+        if self._lock_file is not None:
+            return True
+        path = getattr(self.cache, "path", None)
+        if not path:
+            return True
+        try:
+            import fcntl
+        except ImportError:  # pragma: no cover - non-POSIX hosts
+            return True
+        f = open(f"{path}.prefetch.lock", "a+")
+        try:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            f.close()
+            return False
+        self._lock_file = f
+        return True
+
+    def _loop(self) -> None:
+        while not self._stop.is_set():
+            if not self._acquire_leader():
+                # Another worker is prefetching; take over if it goes away.
+                self._stop.wait(LEADER_RETRY_SECONDS)
+                continue
+            boundary, timeframes = self.next_boundary(datetime.now(NY_TZ))
+            wait = (boundary + self.grace - datetime.now(NY_TZ)).total_seconds()
+            if wait > 0 and self._stop.wait(wait):
+                return
+            try:
+                self.run_once(boundary, timeframes)
+            except Exception:
+                logger.exception("prefetch run at %s failed", boundary)
+
+
+def prefetcher_from_env(cache_factory: Callable[[], Any]) -> Optional[BarClosePrefetcher]:
+    """Build the prefetcher from PREFETCH_* settings; None when not configured.
+
+    Needs PREFETCH_WATCHLIST (comma separated symbols), PREFETCH_CONFIG (YAML
+    in the CLI format), POLYGON_API_KEY and an enabled shared cache.
+    """
+    watchlist = [s.strip() for s in os.environ.get("PREFETCH_WATCHLIST", "").split(",") if s.strip()]
+    config_path = os.environ.get("PREFETCH_CONFIG", "").strip()
+    api_key = os.environ.get("POLYGON_API_KEY")
+    if not watchlist or not config_path:
+        return None
+    # The cache is only opened once prefetching is configured, keeping
+    # NumPy off the startup path otherwise.
+    cache = cache_factory()
+    if cache is None or not api_key:
+        logger.warning("PREFETCH_WATCHLIST set but SHARED_CACHE_PATH or POLYGON_API_KEY missing; prefetch disabled")
+        return None
+
+    from fetch_polygon import load_config
+
+    def client_factory():
+        from polygon_client import PolygonDataClient
+
+        return PolygonDataClient(api_key)
+
+    return BarClosePrefetcher(
+        watchlist,
+        load_config(config_path),
+        client_factory,
+        cache,
+        grace_seconds=float(os.environ.get("PREFETCH_GRACE_SECONDS", DEFAULT_GRACE_SECONDS)),
+    )
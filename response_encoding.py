@@ -0,0 +1,140 @@
+from __future__ import annotations
+
+import json
+import os
+import zlib
+from functools import lru_cache
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+# Content-coding for the large JSON endpoints. zstd needs the optional
+# ``zstandard`` package; gzip is always available. Nothing here imports NumPy
+# so /v1/time_grid stays cheap.
+IDENTITY = "identity"
+GZIP = "gzip"
+ZSTD = "zstd"
+
+DEFAULT_MIN_BYTES = 1024
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 3
+
+_MAGIC = {GZIP: b"\x1f\x8b", ZSTD: b"\x28\xb5\x2f\xfd"}
+
+# Same serialisation settings as Starlette's JSONResponse.
+_JSON_OPTIONS: Dict[str, Any] = {"ensure_ascii": False, "allow_nan": False, "indent": None, "separators": (",", ":")}
+
+
+@lru_cache(maxsize=1)
+def _zstandard():
+    try:
+        import zstandard
+    except ImportError:
+        return None
+    return zstandard
+
+
+def supported_encodings() -> List[str]:
+    """Server preference order."""
+    return [ZSTD, GZIP] if _zstandard() is not None else [GZIP]
+
+
+def min_bytes() -> int:
+    """Bodies smaller than this go out uncompressed (COMPRESS_MIN_BYTES)."""
+    return int(os.environ.get("COMPRESS_MIN_BYTES", DEFAULT_MIN_BYTES))
+
+
+def negotiate(accept_encoding: Optional[str]) -> str:
+    """Pick zstd, gzip or identity from an Accept-Encoding header.
+
+    The client's q-values decide; ties go to the server's preference
+    (zstd over gzip). ``*`` covers codings not listed explicitly and
+    ``q=0`` excludes one.
+    """
+    if not accept_encoding:
+        return IDENTITY
+    weights: Dict[str, float] = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        q = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key.strip().lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        weights[name] = q
+    best = IDENTITY
+    best_q = 0.0
+    for enc in supported_encodings():
+        q = weights.get(enc, weights.get("*", 0.0))
+        if q > best_q:
+            best, best_q = enc, q
+    return best
+
+
+class _Compressor:
+    """Incremental compressor: feed chunks, then ``flush`` once."""
+
+    def __init__(self, encoding: str):
+        self.encoding = encoding
+        if encoding == GZIP:
+            self._obj = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        elif encoding == ZSTD:
+            self._obj = _zstandard().ZstdCompressor(level=ZSTD_LEVEL).compressobj()
+        else:
+            raise ValueError(f"Unsupported content coding: {encoding}")
+
+    def compress(self, chunk: bytes) -> bytes:
+        return self._obj.compress(chunk)
+
+    def flush(self) -> bytes:
+        return self._obj.flush()
+
+
+def compress_chunks(chunks: Iterable[bytes], encoding: str) -> Iterator[bytes]:
+    """Compress ``chunks`` as one stream, yielding output as it is produced."""
+    if encoding == IDENTITY:
+        yield from chunks
+        return
+    comp = _Compressor(encoding)
+    for chunk in chunks:
+        out = comp.compress(chunk)
+        if out:
+            yield out
+    yield comp.flush()
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    return b"".join(compress_chunks([body], encoding))
+
+
+def dumps(value: Any) -> bytes:
+    return json.dumps(value, **_JSON_OPTIONS).encode("utf-8")
+
+
+def export_chunks(export: Dict[str, Any]) -> List[bytes]:
+    """Serialise a finished export as JSON, one chunk for the header and one per frame."""
+    head = {k: v for k, v in export.items() if k != "frames"}
+    chunks = [b"{" + dumps(head)[1:-1] + (b"," if head else b"") + b'"frames":{']
+    for i, (timeframe, rows) in enumerate(export["frames"].items()):
+        chunks.append((b"," if i else b"") + dumps(timeframe) + b":" + dumps(rows))
+    chunks.append(b"}}")
+    return chunks
+
+
+def body_encoding(body: bytes) -> str:
+    """Content coding of a stored body, from its magic number."""
+    for encoding, magic in _MAGIC.items():
+        if body.startswith(magic):
+            return encoding
+    return IDENTITY
+
+
+def encoding_headers(encoding: str) -> Dict[str, str]:
+    headers = {"Vary": "Accept-Encoding"}
+    if encoding != IDENTITY:
+        headers["Content-Encoding"] = encoding
+    return headers
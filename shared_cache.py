@@ -0,0 +1,271 @@
+from __future__ import annotations
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# One SQLite file per host, shared by every uvicorn worker on it. Each entry is
+# a set of equal-length NumPy columns packed into a single blob; the column
+# layout lives in a small JSON header so reads can slice the blob in place.
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    key TEXT PRIMARY KEY,
+    meta TEXT NOT NULL,
+    data BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    expires_at REAL NOT NULL,
+    last_access REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS entries_last_access ON entries (last_access);
+"""
+
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+DEFAULT_LIVE_TTL = 5.0
+DEFAULT_CLOSED_TTL = 24 * 3600.0
+DEFAULT_WRITE_TIMEOUT = 0.25
+DEFAULT_TOUCH_INTERVAL = 60.0
+
+
+class SharedCache:
+    """Host-local cache of NumPy column sets backed by a SQLite file.
+
+    Publishing is a single transaction, so readers in other processes see
+    either the previous entry or the complete new one. The file is kept under
+    ``max_bytes`` by evicting least recently read entries.
+
+    Reads never wait for the write lock: ``last_access`` is refreshed at most
+    every ``touch_interval`` seconds and skipped while another process is
+    writing. Writes wait at most ``write_timeout`` seconds for the lock and
+    are dropped if they don't get it; the cache is an optimisation, so a busy
+    file must never fail a request.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        live_ttl: float = DEFAULT_LIVE_TTL,
+        closed_ttl: float = DEFAULT_CLOSED_TTL,
+        write_timeout: float = DEFAULT_WRITE_TIMEOUT,
+        touch_interval: float = DEFAULT_TOUCH_INTERVAL,
+    ):
+        self.path = path
+        self.max_bytes = int(max_bytes)
+        self.live_ttl = float(live_ttl)
+        self.closed_ttl = float(closed_ttl)
+        self.write_timeout = float(write_timeout)
+        self.touch_interval = float(touch_interval)
+        self.hits = 0
+        self.misses = 0
+        self.dropped_writes = 0
+        self._local = threading.local()
+        with self._conn() as conn:
+            conn.executescript(_SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=self.write_timeout, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str, allow_expired: bool = False) -> Optional[Dict[str, np.ndarray]]:
+        """Return the columns stored under ``key`` as read-only views, or None."""
+        conn = self._conn()
+        row = conn.execute(
+            "SELECT meta, data, expires_at, last_access FROM entries WHERE key = ?", (key,)
+        ).fetchone()
+        now = time.time()
+        if row is None or (row[2] < now and not allow_expired):
+            self.misses += 1
+            return None
+        self.hits += 1
+        if now - row[3] >= self.touch_interval:
+            self._touch(conn, key, now)
+        return _unpack(json.loads(row[0]), row[1])
+
+    def put(self, key: str, columns: Dict[str, np.ndarray], ttl: float) -> None:
+        meta, data = _pack(columns)
+        now = time.time()
+        conn = self._conn()
+        try:
+            with _transaction(conn):
+                conn.execute(
+                    "INSERT OR REPLACE INTO entries (key, meta, data, size, expires_at, last_access) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (key, json.dumps(meta), data, len(data), now + ttl, now),
+                )
+                self._evict(conn)
+        except sqlite3.OperationalError as e:
+            self.dropped_writes += 1
+            logger.debug("shared cache write for %s skipped: %s", key, e)
+
+    def stats(self) -> Dict[str, float]:
+        entries, size = self._conn().execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries"
+        ).fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "entries": entries,
+            "bytes": size,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits / lookups) if lookups else 0.0,
+            "dropped_writes": self.dropped_writes,
+        }
+
+    def _touch(self, conn: sqlite3.Connection, key: str, now: float) -> None:
+        # LRU order is best effort: never wait for another writer here.
+        conn.execute("PRAGMA busy_timeout = 0")
+        try:
+            conn.execute("UPDATE entries SET last_access = ? WHERE key = ?", (now, key))
+        except sqlite3.OperationalError:
+            pass
+        finally:
+            conn.execute(f"PRAGMA busy_timeout = {int(self.write_timeout * 1000)}")
+
+    def _evict(self, conn: sqlite3.Connection) -> None:
+        (total,) = conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()
+        if total <= self.max_bytes:
+            return
+        conn.execute("DELETE FROM entries WHERE expires_at < ?", (time.time(),))
+        (total,) = conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()
+        for key, size in conn.execute(
+            "SELECT key, size FROM entries ORDER BY last_access ASC"
+        ).fetchall():
+            if total <= self.max_bytes:
+                break
+            conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+            total -= size
+
+
+class LocalCache:
+    """In-process LRU with the SharedCache interface, optionally backed by one.
+
+    Used by symbol-affinity workers, which see every request for their
+    symbols, so a small private tier avoids even the SQLite read. Misses fall
+    through to ``backing`` and hits there are kept locally.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int = DEFAULT_MAX_BYTES // 2,
+        backing: Optional[SharedCache] = None,
+        live_ttl: float = DEFAULT_LIVE_TTL,
+        closed_ttl: float = DEFAULT_CLOSED_TTL,
+    ):
+        self.max_bytes = int(max_bytes)
+        self.backing = backing
+        self.live_ttl = backing.live_ttl if backing is not None else float(live_ttl)
+        self.closed_ttl = backing.closed_ttl if backing is not None else float(closed_ttl)
+        self.path = backing.path if backing is not None else None
+        self.hits = 0
+        self.misses = 0
+        self.bytes = 0
+        self._entries: "OrderedDict[str, Tuple[Dict[str, np.ndarray], float, int]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str, allow_expired: bool = False) -> Optional[Dict[str, np.ndarray]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and (entry[1] >= time.time() or allow_expired):
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+        cols = self.backing.get(key, allow_expired=allow_expired) if self.backing is not None else None
+        with self._lock:
+            if cols is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        # The backing entry's remaining TTL is unknown here; keep it briefly.
+        self._store(key, cols, self.live_ttl)
+        return cols
+
+    def put(self, key: str, columns: Dict[str, np.ndarray], ttl: float) -> None:
+        self._store(key, columns, ttl)
+        if self.backing is not None:
+            self.backing.put(key, columns, ttl)
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self.bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits / lookups) if lookups else 0.0,
+            }
+
+    def _store(self, key: str, columns: Dict[str, np.ndarray], ttl: float) -> None:
+        size = sum(int(arr.nbytes) for arr in columns.values())
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.bytes -= old[2]
+            self._entries[key] = (columns, time.time() + ttl, size)
+            self.bytes += size
+            while self.bytes > self.max_bytes and self._entries:
+                _, (_, _, evicted) = self._entries.popitem(last=False)
+                self.bytes -= evicted
+
+
+class _transaction:
+    def __init__(self, conn: sqlite3.Connection):
+        self.conn = conn
+
+    def __enter__(self):
+        self.conn.execute("BEGIN IMMEDIATE")
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        self.conn.execute("ROLLBACK" if exc_type else "COMMIT")
+        return False
+
+
+def _pack(columns: Dict[str, np.ndarray]) -> Tuple[List[List], bytes]:
+    meta: List[List] = []
+    chunks: List[bytes] = []
+    offset = 0
+    for name, arr in columns.items():
+        arr = np.ascontiguousarray(arr)
+        raw = arr.tobytes()
+        meta.append([name, arr.dtype.str, offset, int(arr.shape[0])])
+        chunks.append(raw)
+        offset += len(raw)
+    return meta, b"".join(chunks)
+
+
+def _unpack(meta: List[List], data: bytes) -> Dict[str, np.ndarray]:
+    # np.frombuffer shares memory with the blob: no per-column copies.
+    return {
+        name: np.frombuffer(data, dtype=np.dtype(dtype), count=count, offset=offset)
+        for name, dtype, offset, count in meta
+    }
+
+
+def cache_from_env() -> Optional[SharedCache]:
+    """Build the host cache from SHARED_CACHE_* settings; None when disabled."""
+    path = os.environ.get("SHARED_CACHE_PATH", "").strip()
+    if not path:
+        return None
+    return SharedCache(
+        path,
+        max_bytes=int(float(os.environ.get("SHARED_CACHE_MAX_MB", DEFAULT_MAX_BYTES / 1024 / 1024)) * 1024 * 1024),
+        live_ttl=float(os.environ.get("SHARED_CACHE_LIVE_TTL", DEFAULT_LIVE_TTL)),
+        closed_ttl=float(os.environ.get("SHARED_CACHE_CLOSED_TTL", DEFAULT_CLOSED_TTL)),
+    )
@@ -0,0 +1,39 @@
+import time
+
+import pytest
+
+from polygon_client import Candle, PolygonDataClient
+
+
+class FakeAggregates:
+    """Stand-in for ``PolygonDataClient.fetch_aggregates``.
+
+    Returns one candle at the window end and records every call as
+    ``(symbol, timeframe, end_ny, limit)``. ``delays`` maps a symbol or a
+    timeframe to seconds to sleep before answering.
+    """
+
+    def __init__(self):
+        self.calls = []
+        self.delays = {}
+
+    def __call__(self, symbol, timeframe, end_ny, limit):
+        self.calls.append((symbol, timeframe, end_ny, limit))
+        delay = self.delays.get(symbol, self.delays.get(timeframe, 0))
+        if delay:
+            time.sleep(delay)
+        return [Candle(end_ny, 1.0, 2.0, 0.5, 1.5, 100)]
+
+
+@pytest.fixture
+def fake_aggregates(monkeypatch):
+    """Patch every PolygonDataClient, including ones the API builds, to use a FakeAggregates."""
+    fake = FakeAggregates()
+    monkeypatch.setattr(PolygonDataClient, "fetch_aggregates", staticmethod(fake))
+    return fake
+
+
+@pytest.fixture
+def fake_client(fake_aggregates):
+    """A real PolygonDataClient whose aggregates come from ``fake_aggregates``."""
+    return PolygonDataClient("TEST", rest_client=object())
@@ -0,0 +1,102 @@
+import threading
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+import api
+from admission import AdmissionController, AdmissionRejected, ExportTooCostly, estimate_cost
+
+RSI = {"name": "rsi14", "indicator": "rsi", "params": {"window_size": 14}}
+EMA = {"name": "ema10", "indicator": "ema", "params": {"window_size": 10}}
+
+
+def test_estimate_scales_with_frames_candles_and_indicators():
+    small = estimate_cost(200, {"1m": [RSI]})
+    assert (small.frames, small.candles, small.indicator_passes, small.upstream_calls) == (1, 200, 400, 1)
+
+    big = estimate_cost(50000, {tf: [RSI, EMA] for tf in ("10s", "30s", "1m")})
+    assert big.candles == 150000
+    assert big.upstream_calls == 15
+    assert big.units > 100 * small.units
+
+
+def test_oversized_request_is_rejected_outright():
+    controller = AdmissionController(capacity=10_000)
+    with pytest.raises(ExportTooCostly):
+        controller.acquire("k", estimate_cost(50000, {"10s": [RSI]}))
+    assert controller.rejected == 1
+
+
+def test_queued_request_is_admitted_when_capacity_frees():
+    est = estimate_cost(200, {"1m": [RSI]})
+    controller = AdmissionController(capacity=est.units * 1.5, max_queue_seconds=2.0)
+    first = controller.acquire("a", est)
+
+    threading.Timer(0.1, controller.release, args=(first, {"candles": 200})).start()
+    second = controller.acquire("b", est)
+    assert second.queued_ms >= 50
+    controller.release(second)
+
+    stats = controller.stats()
+    assert stats["admitted"] == 2 and stats["in_flight"] == 0
+    assert stats["recent"][0]["actual"]["candles"] == 200
+    assert stats["recent"][0]["estimate"]["units"] == est.units
+
+
+def test_per_key_limits_and_queue_timeout():
+    est = estimate_cost(200, {"1m": [RSI]})
+    controller = AdmissionController(
+        capacity=est.units * 10, key_limits={"small-key": est.units}, max_queue_seconds=0.05
+    )
+    controller.acquire("small-key", est)
+    with pytest.raises(AdmissionRejected):
+        controller.acquire("small-key", est)
+    # Other keys still fit in the process budget.
+    controller.acquire("other-key", est)
+
+
+def test_export_endpoint_status_codes(monkeypatch):
+    est = estimate_cost(3, {"1m": [RSI]})
+    controller = AdmissionController(capacity=est.units * 1.5, max_queue_seconds=0.05)
+    monkeypatch.setitem(api._shared_cache_state, "admission", controller)
+    body = {
+        "symbol": "TSLA",
+        "as_of": "2025-10-30 10:07:23 -0400",
+        "api_key": "DUMMY",
+        "config": {"max_candles_limit": 50000, "config": {"10s": [RSI]}},
+    }
+    client = TestClient(api.app)
+    # Can never fit: 413, and no Retry-After so clients don't loop.
+    res = client.post("/v1/export", json=body)
+    assert res.status_code == 413
+    assert "Retry-After" not in res.headers
+
+    # Fits, but capacity is taken right now: 429 with Retry-After.
+    controller.acquire("DUMMY", est)
+    body["config"] = {"max_candles_limit": 3, "config": {"1m": [RSI]}}
+    res = client.post("/v1/export", json=body)
+    assert res.status_code == 429
+    assert int(res.headers["Retry-After"]) >= 1
+    assert client.get("/v1/admission").json()["rejected"] == 2
+
+
+def test_capacity_is_held_until_abandoned_frames_stop(monkeypatch, fake_aggregates):
+    fake_aggregates.delays["5m"] = 0.8
+    controller = AdmissionController()
+    monkeypatch.setitem(api._shared_cache_state, "admission", controller)
+    body = {
+        "symbol": "TSLA",
+        "as_of": "2025-10-30 10:07:23 -0400",
+        "api_key": "DUMMY",
+        "config": {"max_candles_limit": 3, "config": {"1m": [EMA], "5m": [EMA]}},
+    }
+    res = TestClient(api.app).post("/v1/export", params={"timeout_ms": 100}, json=body)
+    assert res.json()["frame_status"]["5m"]["status"] == "timed_out"
+    assert controller.in_flight > 0
+
+    deadline = time.time() + 5
+    while controller.in_flight > 0 and time.time() < deadline:
+        time.sleep(0.05)
+    assert controller.in_flight == 0
+    assert controller.stats()["recent"][-1]["actual"]["elapsed_ms"] >= 700
@@ -0,0 +1,121 @@
+import os
+import threading
+import time
+
+import pytest
+
+from affinity import AffinityDispatcher
+from shared_cache import LocalCache
+
+
+def pid_handler(payload, state):
+    if payload.get("die_slot") == state.slot or payload.get("die"):
+        os._exit(1)
+    time.sleep(payload.get("sleep", 0))
+    return {"pid": os.getpid(), "slot": state.slot, "symbol": payload["symbol"]}
+
+
+@pytest.fixture
+def dispatcher():
+    d = AffinityDispatcher(3, handler="test_affinity:pid_handler", respawn_delay=0.5, monitor_interval=0.05)
+    d.start()
+    yield d
+    d.stop()
+
+
+def test_same_symbol_always_hits_same_worker(dispatcher):
+    symbols = ["TSLA", "FPGL", "AAPL", "MSFT", "NVDA", "AMD"]
+    first = {s: dispatcher.call(s, {"symbol": s}, timeout=30) for s in symbols}
+    for s in symbols:
+        again = dispatcher.call(s, {"symbol": s}, timeout=30)
+        assert again["pid"] == first[s]["pid"]
+        assert again["slot"] == dispatcher.owner(s)
+    assert len({r["slot"] for r in first.values()}) > 1
+
+
+def test_dead_worker_is_rebalanced_and_respawned(dispatcher):
+    symbol = "TSLA"
+    victim = dispatcher.owner(symbol)
+    old_pid = dispatcher.call(symbol, {"symbol": symbol}, timeout=30)["pid"]
+
+    # The in-flight request that kills its worker is rerouted, not lost.
+    fut = dispatcher.submit(symbol, {"symbol": symbol, "die_slot": victim})
+    assert fut.result(timeout=30)["slot"] != victim
+    # While the slot is down, its symbols are served by the survivors.
+    moved = dispatcher.call(symbol, {"symbol": symbol}, timeout=30)
+    assert moved["slot"] != victim
+
+    deadline = time.time() + 30
+    while dispatcher.owner(symbol) != victim and time.time() < deadline:
+        time.sleep(0.05)
+    back = dispatcher.call(symbol, {"symbol": symbol}, timeout=30)
+    assert back["slot"] == victim and back["pid"] != old_pid
+    assert dispatcher.stats()["workers"][victim]["restarts"] == 1
+
+
+def test_poison_request_fails_instead_of_crashing_every_worker(dispatcher):
+    fut = dispatcher.submit("TSLA", {"symbol": "TSLA", "die": True})
+    with pytest.raises(RuntimeError, match="worker died"):
+        fut.result(timeout=30)
+    # The first owner and one reroute target died; the third worker never saw it.
+    time.sleep(0.3)
+    workers = dispatcher.stats()["workers"]
+    assert sum(w["restarts"] + (not w["alive"]) for w in workers) == 2
+    assert dispatcher.stats()["unrouted"] == 0 and not dispatcher._pending
+    assert dispatcher.call("AAPL", {"symbol": "AAPL"}, timeout=30)["symbol"] == "AAPL"
+
+
+def test_timed_out_call_is_not_rerouted_and_respawns_back_off(dispatcher):
+    from concurrent.futures import TimeoutError as FutureTimeout
+
+    victim = dispatcher.owner("TSLA")
+    with pytest.raises(FutureTimeout):
+        dispatcher.call("TSLA", {"symbol": "TSLA", "sleep": 0.5}, timeout=0.05)
+    assert not dispatcher._pending
+
+    slot = dispatcher._slots[victim]
+    remaining = []
+    for _ in range(2):
+        # Killed once, then served by the next owner.
+        assert dispatcher.call("TSLA", {"symbol": "TSLA", "die_slot": victim}, timeout=30)["slot"] != victim
+        remaining.append(slot.respawn_at - time.monotonic())
+        while dispatcher.owner("TSLA") != victim:
+            time.sleep(0.02)
+    assert slot.restarts == 2 and slot.crash_streak == 2
+    # Respawn delay doubles (0.5s, then 1s) while the slot keeps dying without
+    # answering; the first bound is exact, the second allows 0.5s for the reroute.
+    assert remaining[1] > 0.5 >= remaining[0]
+
+
+def test_local_cache_is_bounded_and_falls_through(tmp_path):
+    import numpy as np
+
+    from shared_cache import SharedCache
+
+    backing = SharedCache(str(tmp_path / "cache.sqlite"))
+    backing.put("k", {"v": np.arange(10.0)}, ttl=60)
+    local = LocalCache(max_bytes=160, backing=backing)
+    assert local.get("k")["v"][3] == 3.0
+    assert local.stats()["entries"] == 1
+    local.put("a", {"v": np.zeros(10)}, ttl=60)
+    local.put("b", {"v": np.zeros(10)}, ttl=60)
+    assert local.stats()["bytes"] <= 160
+    assert local.get("a") is not None and backing.get("b") is not None
+
+
+def settle_later_handler(payload, state):
+    settle = state.defer_settle()
+    threading.Timer(payload["settle_after"], settle).start()
+    return {"slot": state.slot}
+
+
+def test_on_settled_runs_after_deferred_work_finishes():
+    d = AffinityDispatcher(1, handler="test_affinity:settle_later_handler", monitor_interval=0.05)
+    d.start()
+    try:
+        settled = threading.Event()
+        assert d.call("TSLA", {"settle_after": 0.3}, timeout=30, on_settled=settled.set) == {"slot": 0}
+        assert not settled.is_set()
+        assert settled.wait(5)
+    finally:
+        d.stop()
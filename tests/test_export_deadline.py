@@ -0,0 +1,106 @@
+import time
+from datetime import datetime
+
+import pytest
+import pytz
+from fastapi.testclient import TestClient
+
+import api
+from exporter import build_export
+from polygon_client import PolygonDataClient
+from shared_cache import SharedCache
+
+NY = pytz.timezone("America/New_York")
+AS_OF = NY.localize(datetime(2025, 10, 30, 10, 7, 23))
+FRAMES = {
+    "1m": [{"name": "ema3", "indicator": "ema", "params": {"window_size": 3}}],
+    "5m": [{"name": "ema3", "indicator": "ema", "params": {"window_size": 3}}],
+    "15m": [{"name": "bad", "indicator": "nope", "params": {}}],
+}
+
+
+def test_deadline_returns_fast_frames_and_marks_the_rest(fake_aggregates, fake_client, tmp_path):
+    fake_aggregates.delays["5m"] = 2.0
+    cache = SharedCache(str(tmp_path / "cache.sqlite"))
+
+    started = time.perf_counter()
+    export = build_export(fake_client, "TSLA", AS_OF, 3, FRAMES, cache=cache, deadline_seconds=0.3)
+    assert time.perf_counter() - started < 1.5
+
+    status = export["frame_status"]
+    assert status["1m"] == {"status": "ok"}
+    assert len(export["frames"]["1m"]) == 3
+    assert status["5m"] == {"status": "timed_out", "cached": False}
+    assert export["frames"]["5m"] == []
+    assert status["15m"]["status"] == "error"
+    assert "Unsupported indicator" in status["15m"]["detail"]
+
+
+def test_timed_out_frame_falls_back_to_last_cached_rows(fake_aggregates, fake_client, tmp_path):
+    cache = SharedCache(str(tmp_path / "cache.sqlite"))
+    frames = {"5m": FRAMES["5m"]}
+    warm = build_export(fake_client, "TSLA", AS_OF, 3, frames, cache=cache)
+
+    fake_aggregates.delays["5m"] = 1.0
+    # Expire everything so the frame has to be rebuilt and misses the deadline.
+    cache._conn().execute("UPDATE entries SET expires_at = 0")
+    export = build_export(fake_client, "TSLA", AS_OF, 3, frames, cache=cache, deadline_seconds=0.2)
+    assert export["frame_status"]["5m"] == {"status": "timed_out", "cached": True}
+    assert export["frames"]["5m"] == warm["frames"]["5m"]
+
+
+def test_export_endpoint_accepts_timeout_ms(fake_aggregates):
+    fake_aggregates.delays["5m"] = 1.0
+    body = {
+        "symbol": "tsla",
+        "as_of": "2025-10-30 10:07:23 -0400",
+        "api_key": "DUMMY",
+        "config": {"max_candles_limit": 3, "config": {"1m": FRAMES["1m"], "5m": FRAMES["5m"]}},
+    }
+    res = TestClient(api.app).post("/v1/export", params={"timeout_ms": 300}, json=body)
+    assert res.status_code == 200
+    data = res.json()
+    assert data["ticker"] == "TSLA"
+    assert data["frame_status"]["1m"]["status"] == "ok"
+    assert data["frame_status"]["5m"]["status"] == "timed_out"
+
+
+def test_abandoned_frames_do_not_starve_later_requests(fake_aggregates, fake_client):
+    fake_aggregates.delays["SLOW"] = 2.0
+    slow = {tf: FRAMES["1m"] for tf in ["1m", "2m", "3m", "5m", "10m", "15m", "30m", "1h"]}
+    build_export(fake_client, "SLOW", AS_OF, 3, slow, deadline_seconds=0.2)
+
+    # Shared threads would keep FAST queued behind the 2s sleeps.
+    started = time.perf_counter()
+    export = build_export(fake_client, "FAST", AS_OF, 3, {"1m": FRAMES["1m"]}, deadline_seconds=1.5)
+    assert export["frame_status"]["1m"] == {"status": "ok"}
+    assert time.perf_counter() - started < 1.0
+
+
+def test_upstream_calls_get_the_deadline_as_http_timeout():
+    from polygon_client import _DeadlinePoolManager, upstream_deadline
+
+    class Pool:
+        def request(self, method, url, **kwargs):
+            return kwargs
+
+    pool = _DeadlinePoolManager(Pool())
+    assert pool.request("GET", "/x") == {}
+    with upstream_deadline(time.monotonic() + 2.0):
+        kwargs = pool.request("GET", "/x")
+    assert 0 < kwargs["timeout"].total <= 2.0 and kwargs["retries"] is False
+    with upstream_deadline(time.monotonic() - 1), pytest.raises(TimeoutError):
+        pool.request("GET", "/x")
+
+
+def test_upstream_calls_are_counted_across_frame_threads():
+    from concurrent.futures import ThreadPoolExecutor
+
+    class Rest:
+        def list_aggs(self, **kwargs):
+            return []
+
+    client = PolygonDataClient("KEY", rest_client=Rest())
+    with ThreadPoolExecutor(8) as pool:
+        list(pool.map(lambda _: client.fetch_aggregates("TSLA", "1m", AS_OF, 3), range(400)))
+    assert client.upstream_calls == 400
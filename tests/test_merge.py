@@ -52,3 +52,14 @@ def test_attach_indicators_and_export_rows():
     rows = frame_to_export_rows(merged, tz_label="EDT")
     assert len(rows) == 3
     assert set(["rsi14", "macd_value", "macd_signal", "macd_histogram"]).issubset(rows[0].keys())
+
+
+def test_export_rows_do_not_depend_on_index_resolution():
+    from exporter import _columns_to_frame, _frame_to_columns
+
+    index = pd.date_range("2025-10-30 10:00", periods=2, freq="1min", tz="America/New_York", name="timestamp")
+    for unit in ("s", "ms", "us", "ns"):
+        df = pd.DataFrame({"close": [1.0, 2.0]}, index=index.as_unit(unit))
+        rows = frame_to_export_rows(df, tz_label="EDT")
+        assert [r["timestamp"] for r in rows] == ["2025-10-30 10:00:00 -0400", "2025-10-30 10:01:00 -0400"]
+        assert frame_to_export_rows(_columns_to_frame(_frame_to_columns(df)), tz_label="EDT") == rows
@@ -0,0 +1,94 @@
+from datetime import datetime
+
+import pytz
+
+from prefetch import BarClosePrefetcher
+from shared_cache import SharedCache
+
+NY = pytz.timezone("America/New_York")
+
+CONFIG = {
+    "max_candles_limit": 3,
+    "config": {
+        "1m": [{"name": "ema3", "indicator": "ema", "params": {"window_size": 3}}],
+        "5m": [{"name": "rsi14", "indicator": "rsi", "params": {"window_size": 14}}],
+    },
+}
+
+
+def test_next_boundary_groups_timeframes_closing_together():
+    p = BarClosePrefetcher(["tsla"], CONFIG, lambda: None, cache=None)
+    boundary, tfs = p.next_boundary(NY.localize(datetime(2025, 10, 30, 10, 3, 20)))
+    assert boundary == NY.localize(datetime(2025, 10, 30, 10, 4, 0))
+    assert tfs == ["1m"]
+    boundary, tfs = p.next_boundary(NY.localize(datetime(2025, 10, 30, 10, 4, 20)))
+    assert boundary == NY.localize(datetime(2025, 10, 30, 10, 5, 0))
+    assert sorted(tfs) == ["1m", "5m"]
+
+
+def test_run_once_warms_cache_for_first_user_request(fake_aggregates, fake_client, tmp_path):
+    from exporter import build_frame
+
+    cache = SharedCache(str(tmp_path / "cache.sqlite"))
+    p = BarClosePrefetcher(["tsla"], CONFIG, lambda: fake_client, cache)
+    boundary = NY.localize(datetime(2025, 10, 30, 10, 5, 0))
+
+    assert p.run_once(boundary, ["1m", "5m"]) == 2
+    assert len(fake_aggregates.calls) == 2
+
+    # A user request a few seconds after the close is served from cache.
+    as_of = NY.localize(datetime(2025, 10, 30, 10, 5, 3))
+    build_frame(fake_client, "TSLA", "5m", CONFIG["config"]["5m"], as_of, 3, cache=cache)
+    assert len(fake_aggregates.calls) == 2
+
+
+def test_run_once_skips_closed_session(fake_aggregates, fake_client):
+    p = BarClosePrefetcher(["TSLA"], CONFIG, lambda: fake_client, cache=None)
+    assert p.run_once(NY.localize(datetime(2025, 10, 30, 21, 0, 0)), ["1m"]) == 0
+    assert fake_aggregates.calls == []
+
+
+def test_live_boundary_keeps_history_warm_but_not_the_forming_bar(monkeypatch, fake_aggregates, fake_client, tmp_path):
+    from exporter import build_frame
+    from ny_sessions import align_to_boundary_ny
+
+    monkeypatch.setattr("prefetch.classify_session", lambda dt: "Regular")
+    cache = SharedCache(str(tmp_path / "cache.sqlite"), live_ttl=5, closed_ttl=3600)
+    p = BarClosePrefetcher(["tsla"], CONFIG, lambda: fake_client, cache)
+    boundary = align_to_boundary_ny(datetime.now(NY), "5m")
+
+    assert p.run_once(boundary, ["5m"]) == 1
+    expiry = dict(cache._conn().execute("SELECT key, expires_at FROM entries").fetchall())
+    history = [k for k in expiry if k.startswith("candles:") and k.endswith(f":{int(boundary.timestamp()) - 300}:3")]
+    assert len(history) == 1
+    assert expiry.pop(history[0]) - boundary.timestamp() > 3000
+    assert expiry and all(expires_at - datetime.now().timestamp() <= 5 for expires_at in expiry.values())
+
+    # Once the live entries lapse, only the forming bar goes upstream again.
+    cache._conn().execute("UPDATE entries SET expires_at = 0 WHERE key NOT IN (?)", history)
+    fake_aggregates.calls.clear()
+    build_frame(fake_client, "TSLA", "5m", CONFIG["config"]["5m"], boundary, 3, cache=cache)
+    assert [call[3] for call in fake_aggregates.calls] == [1]
+
+
+def test_next_boundary_is_in_the_future_on_dst_days():
+    config = {"max_candles_limit": 3, "config": {"4h": CONFIG["config"]["1m"], "1d": CONFIG["config"]["1m"]}}
+    p = BarClosePrefetcher(["tsla"], config, lambda: None, cache=None)
+
+    now = NY.localize(datetime(2025, 11, 2, 3, 30))  # EST, after fall-back
+    boundary, tfs = p.next_boundary(now)
+    assert boundary > now
+    assert boundary == NY.localize(datetime(2025, 11, 2, 4, 0)) and tfs == ["4h"]
+
+    now = NY.localize(datetime(2025, 3, 9, 1, 30))  # EST, before spring-forward
+    boundary, tfs = p.next_boundary(now)
+    assert boundary == NY.localize(datetime(2025, 3, 9, 4, 0)) and tfs == ["4h"]
+
+
+def test_forming_4h_window_is_live_on_fall_back_day(tmp_path):
+    from exporter import _ttl
+
+    cache = SharedCache(str(tmp_path / "cache.sqlite"))
+    start = NY.localize(datetime(2025, 11, 2, 0, 0))
+    assert _ttl(cache, start, "4h", now=NY.localize(datetime(2025, 11, 2, 3, 30))) == cache.live_ttl
+    assert _ttl(cache, start, "4h", now=NY.localize(datetime(2025, 11, 2, 4, 0))) == cache.closed_ttl
@@ -0,0 +1,108 @@
+import json
+import zlib
+
+import pytest
+from fastapi.testclient import TestClient
+
+import api
+from response_encoding import GZIP, IDENTITY, ZSTD, compress, export_chunks, negotiate
+from shared_cache import SharedCache
+
+BODY = {
+    "symbol": "tsla",
+    "as_of": "2025-10-30 10:07:23 -0400",
+    "api_key": "DUMMY",
+    "config": {
+        "max_candles_limit": 50,
+        "config": {
+            "1m": [{"name": "ema3", "indicator": "ema", "params": {"window_size": 3}}],
+            "5m": [{"name": "ema3", "indicator": "ema", "params": {"window_size": 3}}],
+        },
+    },
+}
+
+
+def test_negotiate_follows_q_values_then_server_preference(monkeypatch):
+    assert negotiate(None) == IDENTITY
+    assert negotiate("gzip, deflate") == GZIP
+    assert negotiate("gzip;q=0.5, br") == GZIP
+    assert negotiate("gzip;q=0, identity") == IDENTITY
+    assert negotiate("*") in (ZSTD, GZIP)
+    monkeypatch.setattr("response_encoding.supported_encodings", lambda: [ZSTD, GZIP])
+    assert negotiate("gzip, zstd") == ZSTD
+    assert negotiate("gzip, zstd;q=0.4") == GZIP
+
+
+def test_export_chunks_are_valid_json():
+    export = {"ticker": "TSLA", "frames": {"1m": [{"close": 1.5}], "5m": []}, "frame_status": {}}
+    assert json.loads(b"".join(export_chunks(export))) == export
+
+
+def test_time_grid_compresses_only_above_threshold():
+    client = TestClient(api.app)
+    small = client.get("/v1/time_grid", params={"end": "2025-10-30 10:07", "timeframe": "1m", "count": 2},
+                       headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in small.headers
+    assert "Accept-Encoding" in small.headers["vary"]
+
+    large = client.get("/v1/time_grid", params={"end": "2025-10-30 10:07", "timeframe": "1m", "count": 500},
+                       headers={"Accept-Encoding": "gzip"})
+    assert large.headers["content-encoding"] == "gzip"
+    assert len(large.json()["timestamps"]) == 500
+
+
+def test_time_grid_follows_threshold_changes_and_caps_count(monkeypatch):
+    client = TestClient(api.app)
+    params = {"end": "2025-10-30 10:07", "timeframe": "1m", "count": 100}
+    headers = {"Accept-Encoding": "gzip"}
+    assert client.get("/v1/time_grid", params=params, headers=headers).headers["content-encoding"] == "gzip"
+    monkeypatch.setenv("COMPRESS_MIN_BYTES", "1000000")
+    assert "content-encoding" not in client.get("/v1/time_grid", params=params, headers=headers).headers
+
+    too_many = client.get("/v1/time_grid", params={**params, "count": api.MAX_GRID_COUNT + 1})
+    assert too_many.status_code == 422
+
+
+def test_export_body_is_cached_compressed(monkeypatch, fake_aggregates, tmp_path):
+    calls = fake_aggregates.calls
+    monkeypatch.setitem(api._shared_cache_state, "cache", SharedCache(str(tmp_path / "cache.sqlite")))
+    client = TestClient(api.app)
+    headers = {"Accept-Encoding": "gzip"}
+
+    first = client.post("/v1/export", json=BODY, headers=headers)
+    assert first.status_code == 200
+    assert first.headers["content-encoding"] == "gzip"
+    assert first.headers["x-export-cache"] == "miss"
+
+    second = client.post("/v1/export", json=BODY, headers=headers)
+    assert second.headers["x-export-cache"] == "hit"
+    assert second.headers["content-encoding"] == "gzip"
+    assert second.json() == first.json()
+    assert len(calls) == 2
+
+    # Nothing cached under one API key is served to another.
+    other = client.post("/v1/export", json=dict(BODY, api_key="OTHER"), headers=headers)
+    assert other.headers["x-export-cache"] == "miss"
+    assert len(calls) == 4
+
+    key = next(k for (k,) in api.get_shared_cache()._conn().execute("SELECT key FROM entries") if k.startswith("body:"))
+    stored = api.get_shared_cache().get(key)["body"].tobytes()
+    assert json.loads(zlib.decompress(stored, 16 + zlib.MAX_WBITS)) == first.json()
+
+    # Another coding is a separate entry; identity is never compressed.
+    plain = client.post("/v1/export", json=BODY, headers={"Accept-Encoding": "identity"})
+    assert plain.headers["x-export-cache"] == "miss"
+    assert "content-encoding" not in plain.headers
+    assert plain.json() == first.json()
+
+
+def test_zstd_round_trip():
+    zstandard = pytest.importorskip("zstandard")
+    body = b'{"frames":{}}' * 200
+    assert zstandard.ZstdDecompressor().decompressobj().decompress(compress(body, ZSTD)) == body
+
+
+def test_without_zstandard_zstd_is_not_offered(monkeypatch):
+    monkeypatch.setattr("response_encoding._zstandard", lambda: None)
+    assert negotiate("zstd, gzip;q=0.5") == GZIP
+    assert negotiate("zstd") == IDENTITY
@@ -0,0 +1,73 @@
+from datetime import datetime
+
+import numpy as np
+import pytz
+
+from exporter import build_frame
+from shared_cache import SharedCache
+
+NY = pytz.timezone("America/New_York")
+
+
+def test_roundtrip_is_zero_copy_and_shared(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    writer = SharedCache(path)
+    writer.put("k", {"ts": np.arange(4, dtype=np.int64), "close": np.array([1.0, np.nan, 3.0, 4.0])}, ttl=60)
+    writer.put("empty", {"ts": np.array([], dtype=np.int64)}, ttl=60)
+
+    # A second instance stands in for another worker process on the same host.
+    reader = SharedCache(path)
+    cols = reader.get("k")
+    assert cols["ts"].tolist() == [0, 1, 2, 3]
+    assert np.isnan(cols["close"][1])
+    assert not cols["close"].flags.owndata and not cols["close"].flags.writeable
+    assert len(reader.get("empty")["ts"]) == 0
+    assert reader.get("missing") is None
+    assert reader.stats()["hits"] == 2 and reader.stats()["misses"] == 1
+
+
+def test_expiry_and_size_bounded_eviction(tmp_path):
+    cache = SharedCache(str(tmp_path / "cache.sqlite"), max_bytes=2 * 800)
+    cache.put("stale", {"v": np.zeros(1)}, ttl=-1)
+    assert cache.get("stale") is None
+    assert cache.get("stale", allow_expired=True) is not None
+
+    for i in range(4):
+        cache.put(f"k{i}", {"v": np.zeros(100)}, ttl=60)  # 800 bytes each
+    assert cache.stats()["bytes"] <= cache.max_bytes
+    assert cache.get("k3") is not None
+    assert cache.get("k0") is None
+
+
+def test_build_frame_reuses_cached_frame(fake_aggregates, fake_client, tmp_path):
+    end = NY.localize(datetime(2025, 10, 30, 10, 5, 0))
+    cache = SharedCache(str(tmp_path / "cache.sqlite"))
+    indicators = [{"name": "ema3", "indicator": "ema", "params": {"window_size": 3}}]
+
+    first = build_frame(fake_client, "TSLA", "1m", indicators, end, 5, cache=cache)
+    second = build_frame(fake_client, "TSLA", "1m", indicators, end, 5, cache=cache)
+    assert len(fake_aggregates.calls) == 1
+    assert first == second
+    assert first[-1]["timestamp"] == "2025-10-30 10:05:00 -0400"
+
+
+def test_locked_file_never_blocks_or_fails(tmp_path):
+    import sqlite3
+    import time
+
+    path = str(tmp_path / "cache.sqlite")
+    cache = SharedCache(path, touch_interval=0)
+    cache.put("k", {"v": np.arange(3.0)}, ttl=60)
+
+    # Another worker holds the write lock for the whole check.
+    other = sqlite3.connect(path, isolation_level=None)
+    other.execute("BEGIN IMMEDIATE")
+    try:
+        started = time.perf_counter()
+        assert cache.get("k")["v"][2] == 2.0
+        cache.put("new", {"v": np.zeros(3)}, ttl=60)
+        assert time.perf_counter() - started < 1.0
+    finally:
+        other.execute("ROLLBACK")
+    assert cache.get("new") is None
+    assert cache.stats()["dropped_writes"] == 1
@@ -0,0 +1,12 @@
+import bench_startup
+
+
+def test_cold_start_skips_heavy_imports():
+    for target in ("api", "fetch_polygon"):
+        report = bench_startup.run_probe(target)
+        assert report["heavy"] == [], f"{target} imported {report['heavy']} at startup"
+
+
+def test_cold_start_within_budget():
+    result = bench_startup.measure("api", runs=3)
+    assert result["median_ms"] <= bench_startup.budget_ms()
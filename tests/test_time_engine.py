@@ -0,0 +1,117 @@
+import random
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytz
+
+import time_engine as te
+from ny_sessions import align_to_boundary_ny, generate_time_grid
+
+NY = pytz.timezone("America/New_York")
+UTC = pytz.UTC
+
+# 1970 .. 2040 plus dense samples around every DST switch in 2024-2026.
+_rng = random.Random(20251030)
+EPOCHS = [_rng.randrange(0, 2_208_988_800) for _ in range(3000)]
+for _t in te._TRANS_EPOCH:
+    if 1_700_000_000 < _t < 1_800_000_000:
+        EPOCHS += [_t + d for d in range(-7200, 7201, 450)]
+
+
+def _ref(epoch):
+    return datetime.fromtimestamp(epoch, UTC).astimezone(NY)
+
+
+def test_ny_datetime_matches_pytz():
+    for e in EPOCHS:
+        got, ref = te.ny_datetime(e), _ref(e)
+        assert got == ref
+        assert got.replace(tzinfo=None) == ref.replace(tzinfo=None)
+        assert got.strftime("%z %Z") == ref.strftime("%z %Z")
+        assert te.format_epoch(e) == ref.strftime("%Y-%m-%d %H:%M:%S %z")
+
+
+def test_batched_conversion_matches_scalar():
+    arr = np.array(EPOCHS, dtype=np.int64)
+    assert te.ny_datetimes(arr) == [_ref(e) for e in EPOCHS]
+    assert te.ny_datetimes(arr * 1000 + 250, unit="ms")[0] == _ref(EPOCHS[0]) + timedelta(milliseconds=250)
+    assert te.utc_offsets(arr).tolist() == [int(_ref(e).utcoffset().total_seconds()) for e in EPOCHS]
+    assert te.format_epochs(arr[:50]) == [te.format_epoch(e) for e in EPOCHS[:50]]
+
+
+def test_naive_wall_time_matches_pytz_localize():
+    walls = [datetime(2025, 3, 9, 2, 30), datetime(2025, 11, 2, 1, 30), datetime(2025, 11, 2, 1, 0)]
+    walls += [datetime(1970, 1, 1) + timedelta(seconds=_rng.randrange(0, 2_100_000_000)) for _ in range(2000)]
+    for naive in walls:
+        assert te.epoch_seconds(naive) == int(NY.localize(naive).timestamp())
+
+
+def test_snap_is_session_anchored_across_dst():
+    for seconds in (10, 60, 300, 3600, 7200, 14400, 86400):
+        snapped = te.snap_epochs(np.array(EPOCHS, dtype=np.int64), seconds).tolist()
+        for e, s in zip(EPOCHS, snapped):
+            assert s == te.snap_epoch(e, seconds)
+            assert s <= e < s + seconds + 3600
+            wall = _ref(s)
+            on_grid = (wall.hour * 3600 + wall.minute * 60 + wall.second) % seconds == 0
+            # A 02:00 start skipped in March lands on the transition (03:00 EDT).
+            assert on_grid or (wall.month, wall.hour) == (3, 3)
+
+
+def test_align_4h_and_1d_land_on_ny_session_times():
+    for dt in (
+        NY.localize(datetime(2025, 10, 30, 10, 7, 23)),  # EDT
+        NY.localize(datetime(2025, 12, 1, 10, 7, 23)),  # EST
+    ):
+        h4 = align_to_boundary_ny(dt, "4h")
+        assert (h4.hour, h4.minute) == (8, 0)
+        d1 = align_to_boundary_ny(dt, "1d")
+        assert (d1.date(), d1.hour) == (dt.date(), 0)
+        assert d1.utcoffset() == dt.utcoffset()
+
+
+def test_grid_labels_carry_correct_offsets_across_fall_back():
+    end = align_to_boundary_ny(NY.localize(datetime(2025, 11, 2, 2, 30)), "1h")
+    grid = generate_time_grid(end, 4, "1h")
+    stamps = [ts.strftime("%H:%M %z") for ts in grid]
+    # Both 01:00 hours exist on the grid, each with its own offset.
+    assert stamps == ["00:00 -0400", "01:00 -0400", "01:00 -0500", "02:00 -0500"]
+
+    daily = generate_time_grid(align_to_boundary_ny(end, "1d"), 3, "1d")
+    assert [ts.strftime("%m-%d %H:%M %z") for ts in daily] == ["10-31 00:00 -0400", "11-01 00:00 -0400", "11-02 00:00 -0400"]
+
+
+def test_ny_grid_matches_pointwise_conversion():
+    for end in (1762063200 + 7200, 1741503600 + 3600, 1761833220):
+        for seconds in (60, 3600, 14400, 86400):
+            epochs = te.grid_epochs(end, 300, seconds)
+            assert te.ny_grid(end, 300, seconds) == [_ref(e) for e in epochs]
+            assert [g.strftime("%z") for g in te.ny_grid(end, 300, seconds)] == [_ref(e).strftime("%z") for e in epochs]
+
+
+def test_bucket_end_runs_in_wall_time_across_dst():
+    def end(wall, seconds):
+        start = int(NY.localize(wall).timestamp())
+        return te.ny_datetime(te.bucket_end(start, seconds))
+
+    fall, spring = datetime(2025, 11, 2), datetime(2025, 3, 9)
+    assert end(fall, 14400) == NY.localize(datetime(2025, 11, 2, 4))
+    assert end(fall, 14400).strftime("%z") == "-0500"
+    assert end(fall, 86400) == NY.localize(datetime(2025, 11, 3))
+    assert end(spring, 14400) == NY.localize(datetime(2025, 3, 9, 4))
+    assert end(spring, 14400).strftime("%z") == "-0400"
+    # Hour divisors step in absolute time: both 01:00 hours are separate bars.
+    first_one_am = NY.localize(datetime(2025, 11, 2, 1), is_dst=True)
+    assert te.bucket_end(int(first_one_am.timestamp()), 3600) == int(first_one_am.timestamp()) + 3600
+    assert te.previous_bucket(int(NY.localize(datetime(2025, 11, 2, 4)).timestamp()), 14400) == int(
+        NY.localize(fall).timestamp()
+    )
+
+
+def test_probed_table_matches_pytz_internals():
+    probed = te._table_from_probing()
+    internal = te._table_from_pytz()
+    start = probed[0][0]
+    # Before the probe range both tables hold the same (LMT) entry.
+    assert probed[0][1:] == [r for r in internal if r[0] <= start][-1][1:]
+    assert probed[1:] == [r for r in internal if r[0] > start]
@@ -0,0 +1,311 @@
+from __future__ import annotations
+
+import logging
+from bisect import bisect_right
+from datetime import datetime, timedelta, timezone, tzinfo
+from functools import lru_cache
+from typing import TYPE_CHECKING, List, Optional, Tuple
+
+import pytz
+
+if TYPE_CHECKING:
+    import numpy as np
+
+# America/New_York as a precomputed transition table, taken from pytz so every
+# conversion here agrees with pytz exactly (including its behaviour past 2037).
+# Scalar helpers are pure Python (bisect) so the cheap endpoints stay free of
+# NumPy; the batched helpers import NumPy on first use.
+NY_TZ = pytz.timezone("America/New_York")
+
+logger = logging.getLogger(__name__)
+
+_EPOCH_NAIVE = datetime(1970, 1, 1)
+_SECOND = timedelta(seconds=1)
+
+_EPOCH_UTC = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+# Range probed when pytz's internals are unavailable; pytz has no
+# transitions past 2037, so nothing later is lost.
+_PROBE_FIRST_YEAR = 1800
+_PROBE_LAST_YEAR = 2100
+
+_Transition = Tuple[int, int, bool, tzinfo]
+
+
+def _table_from_pytz() -> List[_Transition]:
+    # Fast path: pytz keeps the table in private attributes.
+    table = [
+        ((at - _EPOCH_NAIVE) // _SECOND, int(info[0].total_seconds()), bool(info[1]), NY_TZ._tzinfos[info])
+        for at, info in zip(NY_TZ._utc_transition_times, NY_TZ._transition_info)
+    ]
+    if not table or any(a[0] >= b[0] for a, b in zip(table, table[1:])):
+        raise ValueError("unexpected pytz transition table layout")
+    return table
+
+
+def _table_from_probing(first_year: int = _PROBE_FIRST_YEAR, last_year: int = _PROBE_LAST_YEAR) -> List[_Transition]:
+    """Rebuild the table through public conversions only.
+
+    Steps a day at a time and bisects to the second wherever the zone's
+    tzinfo (offset, DST flag or name) changes.
+    """
+
+    def probe(epoch: int) -> datetime:
+        return (_EPOCH_UTC + timedelta(seconds=epoch)).astimezone(NY_TZ)
+
+    def row(epoch: int, local: datetime) -> _Transition:
+        return (epoch, int(local.utcoffset().total_seconds()), bool(local.dst()), local.tzinfo)
+
+    start = int((datetime(first_year, 1, 1, tzinfo=timezone.utc) - _EPOCH_UTC).total_seconds())
+    end = int((datetime(last_year, 1, 1, tzinfo=timezone.utc) - _EPOCH_UTC).total_seconds())
+    current = probe(start)
+    table = [row(start, current)]
+    t = start
+    while t < end:
+        nxt = probe(t + 86400)
+        if nxt.tzinfo is not current.tzinfo:
+            lo, hi = t, t + 86400  # lo is before the change, hi after it
+            while hi - lo > 1:
+                mid = (lo + hi) // 2
+                if probe(mid).tzinfo is current.tzinfo:
+                    lo = mid
+                else:
+                    hi = mid
+            current = probe(hi)
+            table.append(row(hi, current))
+            # Two changes within one day do not occur in this zone.
+        t += 86400
+    return table
+
+
+try:
+    _TABLE = _table_from_pytz()
+except Exception as _exc:  # a pytz release changed its private layout
+    logger.warning("pytz internals unavailable (%s); probing the America/New_York table instead", _exc)
+    _TABLE = _table_from_probing()
+
+_TRANS_EPOCH: List[int] = [t[0] for t in _TABLE]
+_TRANS_OFFSET: List[int] = [t[1] for t in _TABLE]
+_TRANS_DST: List[bool] = [t[2] for t in _TABLE]
+_TRANS_TZINFO: List[tzinfo] = [t[3] for t in _TABLE]
+
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S %z"
+
+
+def _index_at(epoch: int) -> int:
+    return max(bisect_right(_TRANS_EPOCH, epoch) - 1, 0)
+
+
+def utc_offset(epoch: int) -> int:
+    """NY UTC offset in seconds at a UTC epoch second."""
+    return _TRANS_OFFSET[_index_at(epoch)]
+
+
+def epoch_seconds(dt: datetime) -> int:
+    """Floor UTC epoch seconds of ``dt``; naive values are NY wall time (pytz is_dst=False)."""
+    if dt.tzinfo is None:
+        return wall_to_epoch((dt - _EPOCH_NAIVE) // _SECOND)
+    return (dt.replace(tzinfo=None) - dt.utcoffset() - _EPOCH_NAIVE) // _SECOND
+
+
+def to_ny_datetime(dt: datetime) -> datetime:
+    """Convert an aware datetime to NY, keeping microseconds; same result as ``astimezone``."""
+    naive_utc = dt.replace(tzinfo=None) - dt.utcoffset()
+    idx = _index_at((naive_utc - _EPOCH_NAIVE) // _SECOND)
+    return (naive_utc + timedelta(seconds=_TRANS_OFFSET[idx])).replace(tzinfo=_TRANS_TZINFO[idx])
+
+
+def ny_datetime(epoch: int) -> datetime:
+    idx = _index_at(epoch)
+    wall = _EPOCH_NAIVE + timedelta(seconds=epoch + _TRANS_OFFSET[idx])
+    return wall.replace(tzinfo=_TRANS_TZINFO[idx])
+
+
+def wall_to_epoch(wall: int, not_after: Optional[int] = None) -> int:
+    """UTC epoch of NY wall-clock seconds since 1970-01-01 00:00 (wall time).
+
+    Ambiguous wall times (the repeated hour in November) resolve to standard
+    time like pytz's ``is_dst=False``, or to the latest instant not after
+    ``not_after`` when given. Wall times skipped in March resolve to the
+    transition instant, again matching ``is_dst=False``.
+    """
+    i = _index_at(wall)
+    valid: List[int] = []
+    std: Optional[int] = None
+    for j in range(max(i - 1, 0), min(i + 2, len(_TRANS_EPOCH))):
+        epoch = wall - _TRANS_OFFSET[j]
+        if _index_at(epoch) == j:
+            valid.append(j)
+        if not _TRANS_DST[j] and std is None:
+            std = j
+    if not_after is not None:
+        candidates = [wall - _TRANS_OFFSET[j] for j in valid if wall - _TRANS_OFFSET[j] <= not_after]
+        if candidates:
+            return max(candidates)
+    for j in valid:
+        if not _TRANS_DST[j]:
+            return wall - _TRANS_OFFSET[j]
+    if valid:
+        return wall - _TRANS_OFFSET[valid[0]]
+    return wall - _TRANS_OFFSET[std if std is not None else i]
+
+
+def is_hour_divisor(seconds: int) -> bool:
+    # NY offsets are whole hours, so grids with a period dividing an hour are
+    # the same in UTC and wall time and can step in absolute time.
+    return 3600 % seconds == 0
+
+
+def snap_epoch(epoch: int, seconds: int) -> int:
+    """Start of the NY session-anchored bucket of ``seconds`` containing ``epoch``.
+
+    Buckets are anchored on NY wall-clock midnight, so 4h bars start at
+    00/04/08/12/16/20 local and 1d bars at local midnight across DST.
+    """
+    wall = epoch + utc_offset(epoch)
+    if is_hour_divisor(seconds):
+        return epoch - wall % seconds
+    return wall_to_epoch(wall - wall % seconds, not_after=epoch)
+
+
+def bucket_end(start: int, seconds: int) -> int:
+    """Instant the bucket starting at ``start`` closes.
+
+    Coarse buckets end ``seconds`` later in wall time, not in absolute time:
+    the 00:00 4h bar on the November fall-back day runs five real hours, to
+    04:00 EST, and the March one three, to 04:00 EDT.
+    """
+    if is_hour_divisor(seconds):
+        return start + seconds
+    return wall_to_epoch(start + utc_offset(start) + seconds)
+
+
+def previous_bucket(start: int, seconds: int) -> int:
+    """Start of the bucket before the one starting at ``start``."""
+    return snap_epoch(start - 1, seconds)
+
+
+def grid_epochs(end_epoch: int, count: int, seconds: int) -> List[int]:
+    """``count`` bucket starts ending at ``end_epoch`` (inclusive), oldest first."""
+    if is_hour_divisor(seconds):
+        return [end_epoch - k * seconds for k in range(count - 1, -1, -1)]
+    end_wall = end_epoch + utc_offset(end_epoch)
+    return [wall_to_epoch(end_wall - k * seconds) for k in range(count - 1, -1, -1)]
+
+
+def ny_grid(end_epoch: int, count: int, seconds: int) -> List[datetime]:
+    """``grid_epochs`` as NY datetimes.
+
+    Within one offset segment consecutive points differ only in wall time, so
+    each point is derived from the previous one; the table is consulted again
+    only when the grid crosses a transition.
+    """
+    out: List[datetime] = []
+    seg_start = seg_end = 0
+    prev_epoch = 0
+    prev: Optional[datetime] = None
+    for epoch in grid_epochs(end_epoch, count, seconds):
+        if prev is not None and seg_start <= epoch < seg_end:
+            prev = prev + timedelta(seconds=epoch - prev_epoch)
+        else:
+            idx = _index_at(epoch)
+            seg_start = _TRANS_EPOCH[idx]
+            seg_end = _TRANS_EPOCH[idx + 1] if idx + 1 < len(_TRANS_EPOCH) else float("inf")
+            prev = ny_datetime(epoch)
+        prev_epoch = epoch
+        out.append(prev)
+    return out
+
+
+@lru_cache(maxsize=65536)
+def format_epoch(epoch: int) -> str:
+    """``YYYY-mm-dd HH:MM:SS ±HHMM`` in NY; cached since exports repeat timestamps heavily."""
+    return ny_datetime(epoch).strftime(TIMESTAMP_FORMAT)
+
+
+# --- batched (int64 epoch arrays) ---
+
+_TRANS_ARRAYS = None
+
+
+def _transition_arrays():
+    import numpy as np
+
+    global _TRANS_ARRAYS
+    if _TRANS_ARRAYS is None:
+        _TRANS_ARRAYS = (
+            np.asarray(_TRANS_EPOCH, dtype=np.int64),
+            np.asarray(_TRANS_OFFSET, dtype=np.int64),
+            np.asarray(_TRANS_DST, dtype=bool),
+        )
+    return _TRANS_ARRAYS
+
+
+def _indices_at(epochs: "np.ndarray") -> "np.ndarray":
+    import numpy as np
+
+    trans, _, _ = _transition_arrays()
+    return np.maximum(np.searchsorted(trans, epochs, side="right") - 1, 0)
+
+
+def utc_offsets(epochs: "np.ndarray") -> "np.ndarray":
+    """Vectorised ``utc_offset`` over int64 epoch seconds."""
+    _, offsets, _ = _transition_arrays()
+    return offsets[_indices_at(epochs)]
+
+
+def wall_seconds(epochs: "np.ndarray") -> "np.ndarray":
+    """NY wall-clock seconds since 1970-01-01 00:00 for int64 epoch seconds."""
+    import numpy as np
+
+    epochs = np.asarray(epochs, dtype=np.int64)
+    return epochs + utc_offsets(epochs)
+
+
+def snap_epochs(epochs: "np.ndarray", seconds: int) -> "np.ndarray":
+    """Vectorised ``snap_epoch``."""
+    import numpy as np
+
+    epochs = np.asarray(epochs, dtype=np.int64)
+    wall = wall_seconds(epochs)
+    if is_hour_divisor(seconds):
+        return epochs - wall % seconds
+    # Coarse buckets: away from a transition the bucket start has the same
+    # offset as the transition before it; starts within a day of a transition
+    # go through the scalar tie-breaking rules.
+    trans, offsets, _ = _transition_arrays()
+    start_wall = wall - wall % seconds
+    idx = _indices_at(start_wall)
+    after = np.minimum(idx + 1, len(trans) - 1)
+    near = (start_wall - trans[idx] < 86400) | (trans[after] - start_wall < 86400)
+    out = start_wall - offsets[idx]
+    for k in np.nonzero(near)[0]:
+        out[k] = wall_to_epoch(int(start_wall[k]), not_after=int(epochs[k]))
+    return out
+
+
+def ny_datetimes(epochs: "np.ndarray", unit: str = "s") -> List[datetime]:
+    """NY datetimes for an int64 epoch array in seconds (``unit="s"``) or milliseconds (``"ms"``)."""
+    import numpy as np
+
+    epochs = np.asarray(epochs, dtype=np.int64)
+    if unit == "ms":
+        secs, millis = np.divmod(epochs, 1000)
+    elif unit == "s":
+        secs, millis = epochs, np.zeros_like(epochs)
+    else:
+        raise ValueError(f"Unsupported unit: {unit}")
+    idx = _indices_at(secs)
+    _, offsets, _ = _transition_arrays()
+    walls = (secs + offsets[idx]).tolist()
+    return [
+        (_EPOCH_NAIVE + timedelta(seconds=w, milliseconds=ms)).replace(tzinfo=_TRANS_TZINFO[i])
+        for w, ms, i in zip(walls, millis.tolist(), idx.tolist())
+    ]
+
+
+def format_epochs(epochs: "np.ndarray") -> List[str]:
+    """Vectorised ``format_epoch`` (int64 epoch seconds)."""
+    import numpy as np
+
+    return [format_epoch(e) for e in np.asarray(epochs, dtype=np.int64).tolist()]